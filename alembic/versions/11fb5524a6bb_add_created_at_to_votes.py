@@ -0,0 +1,37 @@
+"""add created_at to votes
+
+Revision ID: 11fb5524a6bb
+Revises: 8fbe80b165a9
+Create Date: 2026-10-18 17:52:09.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '11fb5524a6bb'
+down_revision = '8fbe80b165a9'
+branch_labels = None
+depends_on = None
+
+
+# when each vote was cast, GET /posts/trending weighs recent votes more (see app/ranking.py)
+# existing votes get the time of the migration
+
+def upgrade():
+    op.add_column(
+        "votes",
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False, server_default=sa.text("current_timestamp"))
+    )
+
+    # concurrently, like the indexes in 7e4970c07086: votes is written on every like
+    with op.get_context().autocommit_block():
+        op.create_index("ix_votes_created_at", "votes", ["created_at"], postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_votes_created_at", table_name="votes", postgresql_concurrently=True)
+
+    op.drop_column("votes", "created_at")
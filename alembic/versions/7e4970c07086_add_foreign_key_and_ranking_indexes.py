@@ -0,0 +1,45 @@
+"""add foreign key and ranking indexes
+
+Revision ID: 7e4970c07086
+Revises: 11fb5524a6bb
+Create Date: 2026-10-18 18:07:45.120936
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e4970c07086'
+down_revision = '11fb5524a6bb'
+branch_labels = None
+depends_on = None
+
+
+# posts.user_id     posts of a user, ON DELETE CASCADE from users
+# votes.user_id     votes of a user (the primary key starts with post_id), cascade from users
+# posts.vote_count  GET /posts/top loads the most voted posts (see app/ranking.py)
+#
+# posts.created_at is already covered by ix_posts_created_at_id
+#
+# CREATE INDEX CONCURRENTLY does not block writes while it builds, it cannot run inside
+# a transaction, hence the autocommit block. if it fails it leaves an INVALID index behind:
+# drop it (DROP INDEX CONCURRENTLY name) before running the upgrade again
+
+INDEXES = (
+    ("ix_posts_user_id", "posts", ["user_id"]),
+    ("ix_votes_user_id", "votes", ["user_id"]),
+    ("ix_posts_vote_count_id", "posts", ["vote_count", "id"]),
+)
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,52 @@
+"""add search vector to posts
+
+Revision ID: 8fbe80b165a9
+Revises: c5eca291598c
+Create Date: 2026-10-18 10:41:22.806417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '8fbe80b165a9'
+down_revision = 'c5eca291598c'
+branch_labels = None
+depends_on = None
+
+
+# full text search for GET /posts?search=, replaces title LIKE '%term%' (always a seq scan)
+# generated column (postgres 12+) is filled for existing rows when it is added
+
+# LOCKING: adding a STORED generated column rewrites posts under an ACCESS EXCLUSIVE lock,
+# reads and writes on posts wait for the whole rewrite (roughly as long as copying the table),
+# on a big posts table run this upgrade in a maintenance window. the gin index is then built
+# concurrently (no lock against writes), outside the transaction, like 7e4970c07086
+
+def upgrade():
+    op.add_column(
+        "posts",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+                "setweight(to_tsvector('english', coalesce(content, '')), 'B')",
+                persisted=True
+            )
+        )
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_posts_search_vector", "posts", ["search_vector"], postgresql_using="gin", postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_posts_search_vector", table_name="posts", postgresql_concurrently=True)
+
+    op.drop_column("posts", "search_vector")
@@ -0,0 +1,30 @@
+"""add posts created_at id index
+
+Revision ID: a08a2d9d5df3
+Revises: 219d4d601790
+Create Date: 2026-10-18 09:12:04.511203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a08a2d9d5df3'
+down_revision = '219d4d601790'
+branch_labels = None
+depends_on = None
+
+
+# keyset pagination on GET /posts seeks on (created_at, id) instead of offset
+# built concurrently (no lock against writes on posts while it builds), which cannot run
+# inside a transaction, hence the autocommit block, see 7e4970c07086
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index("ix_posts_created_at_id", "posts", ["created_at", "id"], postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_posts_created_at_id", table_name="posts", postgresql_concurrently=True)
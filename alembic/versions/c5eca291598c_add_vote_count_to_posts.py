@@ -0,0 +1,39 @@
+"""add vote_count to posts
+
+Revision ID: c5eca291598c
+Revises: a08a2d9d5df3
+Create Date: 2026-10-18 10:03:47.120934
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5eca291598c'
+down_revision = 'a08a2d9d5df3'
+branch_labels = None
+depends_on = None
+
+
+# denormalised vote counter, so post reads no longer join/group by votes
+
+def upgrade():
+    op.add_column(
+        "posts",
+        sa.Column("vote_count", sa.Integer(), nullable=False, server_default="0")
+    )
+
+    # backfill from existing votes
+    op.execute(
+        """
+        UPDATE posts
+        SET vote_count = counts.votes
+        FROM (SELECT post_id, count(*) AS votes FROM votes GROUP BY post_id) AS counts
+        WHERE posts.id = counts.post_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_column("posts", "vote_count")
@@ -0,0 +1,195 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from fastapi import Response, status
+
+from .config import settings
+
+""" IN-PROCESS CACHE
+
+- bounded: least recently used entries are evicted past maxsize
+- every entry expires ttl seconds after it was set (bounds staleness across workers,
+each worker has its own copy and only sees invalidations made in its own process)
+- thread safe, sync routes run in starlette's threadpool
+- maxsize 0 turns the cache off
+
+"""
+
+
+class LRUCache:
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()  # key -> (expires at, value), oldest first
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key)
+
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    self.remove(key)  # expired
+
+                self.misses += 1
+                return default
+
+            self.data.move_to_end(key)
+            self.hits += 1
+
+            return item[1]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            self.data.move_to_end(key)
+
+            while len(self.data) > self.maxsize:
+                self.remove(next(iter(self.data)))  # least recently used
+
+    def invalidate(self, key):
+        with self.lock:
+            self.remove(key)
+
+    def remove(self, key):
+        # every removal (expiry, eviction, invalidation) goes through here, lock held
+        self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.data):
+                self.remove(key)
+
+    def stats(self):
+        return {
+            "size": len(self.data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+""" HTTP RESPONSE CACHE
+
+- GET /posts and GET /posts/{id} keep their serialized json body in memory
+- a hit costs neither a query nor serialization
+- bounded by entries (RESPONSE_CACHE_SIZE), an entry by the page size: GET /posts takes
+limit up to POSTS_MAX_LIMIT, larger values get a 422 instead of a huge page kept in memory
+- each entry is tagged with what it contains, writes invalidate by tag:
+
+    post:{id}       every cached response containing that post (update, delete, vote)
+    posts           every list page (create/delete shift pages)
+    posts:search    search pages (an update can change what matches)
+
+- the same entry also answers conditional GETs: ETag (hash of the body, covers vote
+counts and which posts are on a page), If-None-Match that still matches gets a 304 with no body
+- no Last-Modified: the newest updated_at of a page misses votes (they do not touch it)
+and goes backwards when the newest post is deleted, If-Modified-Since would answer 304
+for a changed page
+- Cache-Control private, no-cache: responses are per user (bearer token),
+clients keep them but revalidate every time
+
+"""
+
+CachedResponse = namedtuple("CachedResponse", ["body", "etag", "headers"])
+
+
+class ResponseCache(LRUCache):
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__(maxsize, ttl)
+        self.tags = {}  # tag -> keys
+        self.key_tags = {}  # key -> tags
+
+    def set(self, key, value, tags=()):
+        with self.lock:
+            self.remove(key)  # drop tags of a previous entry
+            super().set(key, value)
+
+            if key in self.data:
+                self.key_tags[key] = tags
+
+                for tag in tags:
+                    self.tags.setdefault(tag, set()).add(key)
+
+    def remove(self, key):
+        super().remove(key)
+
+        for tag in self.key_tags.pop(key, ()):
+            keys = self.tags.get(tag)
+            keys.discard(key)
+
+            if not keys:
+                del self.tags[tag]
+
+    def invalidate_tag(self, tag):
+        with self.lock:
+            for key in list(self.tags.get(tag, ())):
+                self.remove(key)
+
+
+post_responses = ResponseCache(settings.RESPONSE_CACHE_SIZE, settings.RESPONSE_CACHE_TTL_SECONDS)
+
+
+def invalidate_post(id, listed=False, searched=False):
+
+    # drop cached responses after a committed write
+    # listed: the set of posts changed (create/delete), searched: title/content changed
+
+    post_responses.invalidate_tag(f"post:{id}")
+
+    if listed:
+        post_responses.invalidate_tag("posts")
+
+    if searched:
+        post_responses.invalidate_tag("posts:search")
+
+
+def request_key(request):
+
+    # path + sorted query string, so ?a=1&b=2 and ?b=2&a=1 share an entry
+    return request.url.path + "?" + "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+
+
+def make_cached_response(body: bytes, headers=None):
+
+    return CachedResponse(
+        body=body,
+        etag='"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"',
+        headers=headers or {}
+    )
+
+
+def is_not_modified(request, cached: CachedResponse):
+
+    # If-None-Match only, If-Modified-Since is ignored (no Last-Modified is sent)
+
+    if_none_match = request.headers.get("if-none-match")
+
+    if if_none_match is None:
+        return False
+
+    etags = [etag.strip() for etag in if_none_match.split(",")]
+
+    return "*" in etags or any(etag.removeprefix("W/") == cached.etag for etag in etags)
+
+
+def cached_json_response(request, cached: CachedResponse):
+
+    headers = {
+        **cached.headers,
+        "ETag": cached.etag,
+        "Cache-Control": "private, no-cache",
+    }
+
+    if is_not_modified(request, cached):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(content=cached.body, media_type="application/json", headers=headers)
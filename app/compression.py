@@ -0,0 +1,236 @@
+import zlib
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from .config import settings
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+""" RESPONSE COMPRESSION (settings.COMPRESSION_ENABLED)
+
+list responses repeat the same keys (and the nested user) on every row, GET /posts?limit=100
+shrinks ~5-10x with gzip, less to send for slow (mobile) clients and less egress
+
+- negotiated from Accept-Encoding: the encoding with the highest q the client gives, br on a tie
+(when brotli is installed), else the body goes out as it is
+- only text bodies (json, ndjson, text/*) of COMPRESSION_MIN_SIZE bytes or more, small bodies
+barely shrink and cost cpu, bodies that already have a Content-Encoding are left alone
+- whole bodies are compressed in one go with a new Content-Length, big ones (GET /posts/top?limit=1000
+takes ~10 ms) in the threadpool instead of on the event loop (zlib and brotli release the gil)
+- streamed bodies (/export) are compressed chunk by chunk, each chunk is flushed so rows still
+reach the client as they are written, the first chunks are held until COMPRESSION_MIN_SIZE
+bytes are there (a short stream goes out as it is)
+- levels: COMPRESSION_GZIP_LEVEL (1-9), COMPRESSION_BROTLI_QUALITY (0-11), higher is smaller
+and slower, python -m bench compression shows the trade-off on real payloads
+- every compressible response gets Vary: Accept-Encoding, compressed or not (too small, or the
+client takes neither), so a shared cache keeps one copy per encoding and never hands
+a gzip body to a client that did not ask for it
+- compressed responses get a weak ETag (W/"..."): the ETag is of the uncompressed body, cache.is_not_modified
+ignores the W/ so If-None-Match keeps answering 304
+
+"""
+
+COMPRESSIBLE_TYPES = {"application/json", "application/x-ndjson", "application/javascript", "application/xml"}
+
+NOT_COMPRESSED_STATUSES = {204, 206, 304}
+
+THREAD_MIN_SIZE = 256 * 1024  # bytes, bigger bodies are compressed in the threadpool
+
+
+def accepted_encodings(accept_encoding):
+
+    # {encoding: q} from an Accept-Encoding header, e.g. "gzip, br;q=0.8, *;q=0"
+
+    encodings = {}
+
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+
+        if name:
+            encodings[name.strip()] = q
+
+    return encodings
+
+
+def choose_encoding(accept_encoding):
+
+    # "br", "gzip" or None: the one with the highest q (directly or through *) we can make,
+    # q 0 means not acceptable, a tie goes to br (smaller)
+
+    encodings = accepted_encodings(accept_encoding)
+    wildcard = encodings.get("*", 0.0)
+
+    best, best_q = None, 0.0
+
+    for name in ("br", "gzip"):
+        if name == "br" and brotli is None:
+            continue
+
+        q = encodings.get(name, wildcard)
+
+        if q > best_q:
+            best, best_q = name, q
+
+    return best
+
+
+def is_compressible(headers):
+
+    if "content-encoding" in headers:
+        return False
+
+    content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+
+    return content_type.startswith("text/") or content_type in COMPRESSIBLE_TYPES or \
+        content_type.endswith("+json") or content_type.endswith("+xml")
+
+
+class Compressor:
+
+    # one response body, compress() returns what can be sent so far, finish() the rest
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+
+        if encoding == "br":
+            self.brotli = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            self.zlib = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip header
+
+    def compress(self, data, flush=False):
+        if self.encoding == "br":
+            return self.brotli.process(data) + (self.brotli.flush() if flush else b"")
+
+        return self.zlib.compress(data) + (self.zlib.flush(zlib.Z_SYNC_FLUSH) if flush else b"")
+
+    def finish(self, data=b""):
+        if self.encoding == "br":
+            return self.brotli.process(data) + self.brotli.finish()
+
+        return self.zlib.compress(data) + self.zlib.flush()
+
+
+def compress(body, encoding):
+
+    return Compressor(encoding).finish(body)
+
+
+async def compress_body(body, encoding):
+
+    if len(body) < THREAD_MIN_SIZE:
+        return compress(body, encoding)
+
+    return await run_in_threadpool(compress, body, encoding)
+
+
+def mark_compressed(headers, encoding):
+
+    headers["Content-Encoding"] = encoding
+
+    etag = headers.get("etag")
+
+    if etag and not etag.startswith("W/"):
+        headers["ETag"] = "W/" + etag
+
+
+class CompressionMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))  # None: as it is
+
+        start = None  # http.response.start, held until we know whether the body is compressed
+        held = []  # body chunks of a stream, until COMPRESSION_MIN_SIZE bytes
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+
+                if message["status"] in NOT_COMPRESSED_STATUSES or not is_compressible(headers):
+                    passthrough = True
+                    await send(message)
+                    return
+
+                headers.add_vary_header("Accept-Encoding")  # the body depends on it, whatever we send
+
+                if encoding is None:
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is not None:
+                # streaming, already compressing
+                chunk = compressor.compress(body, flush=True) if more_body else compressor.finish(body)
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                return
+
+            held.append(body)
+            size = sum(len(chunk) for chunk in held)
+
+            if size < settings.COMPRESSION_MIN_SIZE:
+                if more_body:
+                    return  # wait for more of the stream
+
+                # too small to be worth it, as it is
+                passthrough = True
+                await send(start)
+                await send({"type": "http.response.body", "body": b"".join(held), "more_body": False})
+                return
+
+            headers = MutableHeaders(scope=start)
+            mark_compressed(headers, encoding)
+
+            if not more_body:
+                # whole body
+                compressed = await compress_body(b"".join(held), encoding)
+                headers["Content-Length"] = str(len(compressed))
+
+                await send(start)
+                await send({"type": "http.response.body", "body": compressed, "more_body": False})
+                return
+
+            # a stream big enough: compress what was held, then every chunk as it comes
+            if "content-length" in headers:
+                del headers["Content-Length"]
+
+            compressor = Compressor(encoding)
+
+            await send(start)
+            await send({"type": "http.response.body", "body": compressor.compress(b"".join(held), flush=True),
+                        "more_body": True})
+
+        await self.app(scope, receive, send_compressed)
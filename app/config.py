@@ -14,6 +14,74 @@ class Settings(BaseSettings):
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
 
+    DATABASE_ASYNC: bool = False  # serve with asyncpg + async def routers instead of psycopg2
+
+    # connection pool per worker (see pool.py), keep workers * (size + overflow) < max_connections
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_TIMEOUT: int = 30  # seconds to wait for a free connection
+    DATABASE_POOL_RECYCLE: int = 1800  # seconds, -1 to never recycle
+    DATABASE_POOL_PRE_PING: bool = True
+    DATABASE_POOL_WARMUP: int = 2  # connections opened per engine when a worker starts, up to DATABASE_POOL_SIZE
+
+    # read only routes served by streaming replicas (see database.py), comma separated postgresql:// urls
+    DATABASE_REPLICA_URLS: str = ""
+    DATABASE_PRIMARY_PIN_SECONDS: int = 5  # a client reads from the primary this long after a write
+
+    # verified users kept in memory by oauth2.get_current_user, 0 to turn off
+    AUTH_CACHE_SIZE: int = 10000
+    AUTH_CACHE_TTL_SECONDS: int = 60
+
+    # serialized GET /posts responses kept in memory (see cache.py), 0 to turn off
+    RESPONSE_CACHE_SIZE: int = 1000
+    RESPONSE_CACHE_TTL_SECONDS: int = 30
+    POSTS_MAX_LIMIT: int = 100  # largest GET /posts page, bounds what one cached page can hold
+
+    FAST_JSON: bool = False  # list endpoints skip pydantic and dump with orjson (see serializers.py)
+
+    # GET /posts/top and /posts/trending (see ranking.py)
+    RANKING_SIZE: int = 1000  # posts kept in memory per ranking, also the largest limit
+    RANKING_REFRESH_SECONDS: int = 60  # reloaded from the database, picks up other workers' votes
+    TRENDING_HALF_LIFE_HOURS: float = 6  # a vote counts half as much after this long
+
+    EXPORT_BATCH_SIZE: int = 1000  # rows fetched from the server side cursor per ndjson chunk
+    INGEST_BATCH_SIZE: int = 1000  # rows validated and copied per transaction (see ingest.py)
+
+    # password hashing (see utility.py)
+    BCRYPT_ROUNDS: int = 12  # cost factor, older hashes are upgraded on login
+    PASSWORD_HASH_WORKERS: int = 2  # worker processes, 0 to hash inline
+
+    # login attempts (see throttle.py): token buckets per client address and per username
+    LOGIN_THROTTLE_BACKEND: str = "memory"  # memory (per worker), redis (shared) or off
+    LOGIN_IP_RATE: float = 0.5  # attempts added back per second
+    LOGIN_IP_BURST: int = 20  # attempts allowed at once
+    LOGIN_USERNAME_RATE: float = 0.1
+    LOGIN_USERNAME_BURST: int = 5
+    REDIS_URL: str = "redis://localhost:6379/0"
+
+    METRICS_ENABLED: bool = True  # request and sql histograms for GET /metrics (see metrics.py)
+
+    # per request sql timings in response headers + slow query log (see profiling.py), off by default
+    SQL_TIMING: bool = False
+    SLOW_QUERY_MS: int = 200  # statements slower than this are logged with their EXPLAIN plan, 0 to turn off
+
+    # gzip / brotli responses (see compression.py)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # bytes, smaller bodies go out as they are
+    COMPRESSION_GZIP_LEVEL: int = 5  # 1 (fastest) - 9 (smallest)
+    COMPRESSION_BROTLI_QUALITY: int = 4  # 0 (fastest) - 11 (smallest), used when brotli is installed
+
+    # python -m app.serve (see serve.py): gunicorn running uvicorn workers
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 0  # 0: one per cpu available to the container (cgroup quota, affinity)
+    SERVER_KEEPALIVE: int = 5  # seconds an idle connection is kept, above the load balancer's idle timeout
+    SERVER_BACKLOG: int = 2048  # connections waiting to be accepted (capped by net.core.somaxconn)
+    SERVER_MAX_REQUESTS: int = 10000  # a worker is replaced after this many requests, 0 never
+    SERVER_MAX_REQUESTS_JITTER: int = 1000  # random extra requests per worker, so they do not restart together
+    SERVER_GRACEFUL_TIMEOUT: int = 30  # seconds a stopping worker has to finish its requests
+    SERVER_PRELOAD: bool = True  # import the app once in the master, workers fork from it
+
     class Config:
         # read from .env file
         env_file = ".env"
@@ -1,7 +1,13 @@
-from sqlalchemy import create_engine
+import logging
+from contextlib import contextmanager
+from itertools import cycle
+from fastapi import Depends, Request
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from .config import settings
+from .pool import TimedQueuePool, TimedAsyncQueuePool, pool_options
+from . import metrics, profiling, replicas
 
 # using environment variables
 
@@ -32,10 +38,108 @@ SQLALCHEMY_DATABASE_URL = "postgresql://{db_username}:{db_password}@{host_name}:
     db_name=settings.DATABASE_NAME
 )
 
+# same database through asyncpg, used when settings.DATABASE_ASYNC is on
+SQLALCHEMY_ASYNC_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
+
+# read replicas, see get_read_db
+SQLALCHEMY_REPLICA_URLS = [url.strip() for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()]
+
+""" ENGINES
+
+- nothing connects (or imports the driver) when this module is imported: the engines are
+made by create_engines(), called by main.create_app's startup handler in every worker
+(after gunicorn forks, so no worker inherits another process' sockets) and by the scripts
+- warm_up_pools() then opens DATABASE_POOL_WARMUP connections per engine before the worker
+takes requests, the first requests do not each pay for a new connection
+- SessionLocal is bound to the engine when it is made, from .database import SessionLocal keeps working
+
+"""
+
+logger = logging.getLogger(__name__)
+
 # talk to database requires a session
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+replica_engines = []
+next_replica = None  # round robin, next() on a cycle is atomic under the gil
+
+
+def create_engines():
+
+    # once per process, returns the primary engine
+
+    global engine, replica_engines, next_replica
+
+    if engine is not None:
+        return engine
+
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=TimedQueuePool, **pool_options(settings))
+    SessionLocal.configure(bind=engine)
+
+    replica_engines = [
+        create_engine(url, poolclass=TimedQueuePool, **pool_options(settings)) for url in SQLALCHEMY_REPLICA_URLS
+    ]
+    next_replica = cycle(replica_engines).__next__
+
+    for instrumented_engine in [engine, *replica_engines]:
+        instrument_engine(instrumented_engine)
+
+    if settings.DATABASE_ASYNC:
+        create_async_engines()
+
+    return engine
+
+
+def instrument_engine(instrumented_engine):
+
+    # instrumented_engine: a sync Engine (for an AsyncEngine pass async_engine.sync_engine)
+
+    if settings.METRICS_ENABLED:
+        metrics.instrument_engine(instrumented_engine)  # sql timings for GET /metrics
+
+    if settings.SQL_TIMING:
+        profiling.instrument_engine(instrumented_engine)  # per request timings + slow query log
+
+
+def warm_up_pool(pooled_engine, connections):
+
+    # every connection is held until the last one is open, so each checkout makes a new one,
+    # then they all go back to the pool (it keeps up to DATABASE_POOL_SIZE idle)
+
+    held = []
+
+    try:
+        for _ in range(min(connections, settings.DATABASE_POOL_SIZE)):
+            held.append(pooled_engine.connect())
+    finally:
+        for conn in held:
+            conn.close()
+
+
+def warm_up_pools():
+
+    # blocking, the sync engines only (see warm_up_async_pools), a database that is down
+    # does not stop the worker from starting, GET /pool and the routes will show it
+
+    for pooled_engine in [engine, *replica_engines]:
+        try:
+            warm_up_pool(pooled_engine, settings.DATABASE_POOL_WARMUP)
+        except Exception as e:
+            logger.warning("connection pool warm up failed for %r: %s", pooled_engine.url, e)
+
+
+def dispose_engines():
+
+    # closes the pooled connections at shutdown, the engines can be made again
+    global engine, replica_engines
+
+    for pooled_engine in [engine, *replica_engines]:
+        if pooled_engine is not None:
+            pooled_engine.dispose()
+
+    engine, replica_engines = None, []
 
 Base = declarative_base()
 
@@ -49,3 +153,157 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+""" READ REPLICAS
+
+- settings.DATABASE_REPLICA_URLS: streaming replicas of the primary (the DATABASE_* settings)
+- read only routes (GET /posts, /posts/{id}, /users, /users/{id} and the exports) take
+get_read_db, a session on the next replica in turn, so reads stop competing with votes on the primary
+- a client that just wrote is pinned to the primary for a few seconds (see replicas.py)
+- get_current_user keeps using the primary (it is cached, see oauth2.py)
+- without replicas (or when pinned) get_read_db is get_db: the same session, one connection
+per request, shared with get_current_user and any write the route does
+
+"""
+
+
+def read_bind(request: Request):
+
+    if not replica_engines or replicas.is_pinned(request):
+        return engine
+
+    return next_replica()
+
+
+def get_read_db(request: Request, db: Session = Depends(get_db)):
+    # get connnection to a replica (or the primary) for read only routes
+
+    bind = read_bind(request)
+
+    if bind is engine:
+        yield db  # the request's get_db session, not a second one on the primary
+        return
+
+    replica_db = SessionLocal(bind=bind)
+
+    try:
+        yield replica_db
+    finally:
+        replica_db.close()
+
+
+@contextmanager
+def count_queries(bind=None):
+
+    # collects every statement sent to the database inside the block, e.g.
+    #
+    #   with count_queries() as statements:
+    #       client.get("/posts?limit=100")
+    #   assert len(statements) == 2  # user lookup + posts joined with users, for any limit, see tests/test_posts.py
+    #
+    # bind: engine to watch, defaults to the sync engine (async: async_engine.sync_engine)
+
+    bind = bind if bind is not None else engine
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(bind, "before_cursor_execute", before_cursor_execute)
+
+    try:
+        yield statements
+    finally:
+        event.remove(bind, "before_cursor_execute", before_cursor_execute)
+
+
+""" ASYNC DATABASE
+
+- a sync session blocks one of starlette's threadpool workers while waiting on postgres
+- with an AsyncSession (asyncpg) the route awaits instead, the event loop keeps serving others
+- only built when settings.DATABASE_ASYNC is on, main.py then mounts the *_async routers
+- expire_on_commit=False: attributes cannot be lazy loaded after commit in async code
+
+"""
+
+async_engine = None
+AsyncSessionLocal = None
+async_replica_engines = []
+next_async_replica = None
+
+
+def create_async_engines():
+
+    # called by create_engines
+
+    global async_engine, AsyncSessionLocal, async_replica_engines, next_async_replica
+
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+    async_engine = create_async_engine(
+        SQLALCHEMY_ASYNC_DATABASE_URL, poolclass=TimedAsyncQueuePool, **pool_options(settings)
+    )
+    AsyncSessionLocal = sessionmaker(
+        autocommit=False, autoflush=False, expire_on_commit=False, bind=async_engine, class_=AsyncSession
+    )
+
+    async_replica_engines = [
+        create_async_engine(
+            url.replace("postgresql://", "postgresql+asyncpg://", 1),
+            poolclass=TimedAsyncQueuePool, **pool_options(settings)
+        )
+        for url in SQLALCHEMY_REPLICA_URLS
+    ]
+    next_async_replica = cycle(async_replica_engines).__next__
+
+    for instrumented_engine in [async_engine, *async_replica_engines]:
+        instrument_engine(instrumented_engine.sync_engine)
+
+
+async def warm_up_async_pools():
+
+    # warm_up_pools for the async engines
+
+    for pooled_engine in [async_engine, *async_replica_engines]:
+        held = []
+
+        try:
+            for _ in range(min(settings.DATABASE_POOL_WARMUP, settings.DATABASE_POOL_SIZE)):
+                held.append(await pooled_engine.connect())
+
+        except Exception as e:
+            logger.warning("connection pool warm up failed for %r: %s", pooled_engine.url, e)
+
+        finally:
+            for conn in held:
+                await conn.close()
+
+
+async def dispose_async_engines():
+
+    global async_engine, async_replica_engines
+
+    for pooled_engine in [async_engine, *async_replica_engines]:
+        if pooled_engine is not None:
+            await pooled_engine.dispose()
+
+    async_engine, async_replica_engines = None, []
+
+
+async def get_async_db():
+    # get async connnection to db
+
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_read_async_db(request: Request, db=Depends(get_async_db)):
+    # async get_read_db
+
+    if not async_replica_engines or replicas.is_pinned(request):
+        yield db  # the request's get_async_db session
+        return
+
+    async with AsyncSessionLocal(bind=next_async_replica()) as replica_db:
+        yield replica_db
@@ -0,0 +1,281 @@
+import argparse
+import codecs
+import csv
+import io
+import json
+import os
+import time
+from itertools import islice
+from pydantic import ValidationError
+
+from .config import settings
+from .database import SessionLocal, create_engines
+from . import schemas, models, cache
+
+""" BULK POST INGEST
+
+posts for one user from an ndjson or csv file, loaded with postgres COPY instead of
+one INSERT (and one http request) per post
+
+- the file is read a batch at a time, memory depends on INGEST_BATCH_SIZE, not the file size
+- every record is validated with schemas.PostIn, invalid ones are skipped and reported by line
+- each batch is copied and committed in its own transaction, a batch the database
+rejects is rolled back and reported, the batches before it are kept
+- user_id always comes from the caller, never from the file
+
+formats:
+
+    ndjson    one json object per line: {"title": ..., "content": ..., "published": ...}
+    csv       header row with title, content and (optional) published
+
+commands:
+
+    python -m app.ingest posts.ndjson --email user@example.com
+    python -m app.ingest posts.csv --email user@example.com --batch-size 5000
+
+over http: POST /posts/bulk with the file as multipart form data (see routers/post.py)
+
+"""
+
+FORMATS = {
+    ".csv": "csv",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+MAX_ERRORS_PER_BATCH = 10  # reported per batch, the rejected count is always complete
+
+COPY_POSTS = "COPY posts (title, content, published, user_id) FROM STDIN WITH (FORMAT csv)"
+
+
+def detect_format(filename, content_type=None):
+
+    # None when neither the extension nor the content type is known
+    extension = os.path.splitext(filename or "")[1].lower()
+
+    return FORMATS.get(extension) or FORMATS.get(content_type)
+
+
+# -- Reading -------------------------------------------------------------------
+
+def read_records(file, fmt):
+
+    # file: opened in binary mode, yields (line number, raw record) without reading ahead
+    lines = codecs.iterdecode(file, "utf-8-sig")
+
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+
+        for row in reader:
+            yield reader.line_num, row
+
+    else:
+        for line_number, line in enumerate(lines, start=1):
+            if line.strip():
+                yield line_number, line
+
+
+def parse_record(record, fmt):
+
+    # raises ValueError (bad json, wrong number of csv fields, ValidationError)
+
+    if fmt == "csv":
+        if None in record or None in record.values():
+            raise ValueError("wrong number of fields")
+
+        if record.get("published") == "":
+            del record["published"]  # empty column, use the default
+
+    else:
+        record = json.loads(record)
+
+    return schemas.PostIn.parse_obj(record)
+
+
+def error_detail(e):
+
+    if isinstance(e, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+
+    return str(e)
+
+
+# -- Loading -------------------------------------------------------------------
+
+def copy_posts(db, posts, user_id):
+
+    # posts written as csv into memory, then streamed to COPY through the session's connection
+    # QUOTE_NONNUMERIC: empty strings are quoted, unquoted empty means NULL to COPY
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC)
+
+    for post in posts:
+        writer.writerow((post.title, post.content, "t" if post.published else "f", user_id))
+
+    buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+
+    try:
+        cursor.copy_expert(COPY_POSTS, buffer)
+    finally:
+        cursor.close()
+
+
+def ingest_batch(db, number, records, fmt, user_id):
+
+    # imported here, not at the top: app.main imports this module, and the driver is
+    # loaded by database.create_engines() in the startup handler, not by importing the app
+    # (tests/test_imports.py)
+    from psycopg2 import Error as DatabaseError
+
+    started = time.perf_counter()
+    posts, errors = [], []
+
+    for line, record in records:
+        try:
+            posts.append(parse_record(record, fmt))
+        except ValueError as e:
+            errors.append({"line": line, "detail": error_detail(e)})
+
+    inserted = 0
+
+    if posts:
+        try:
+            copy_posts(db, posts, user_id)
+            db.commit()
+            inserted = len(posts)
+
+        except DatabaseError as e:
+            db.rollback()
+            errors.insert(0, {"line": records[0][0], "detail": f"batch rejected: {(e.pgerror or str(e)).strip()}"})
+
+    return {
+        "batch": number,
+        "rows": len(records),
+        "inserted": inserted,
+        "rejected": len(records) - inserted,
+        "errors": errors[:MAX_ERRORS_PER_BATCH],
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def ingest_batches(db, file, fmt, user_id, batch_size=None):
+
+    # yields one schemas.IngestBatch dict per batch, as soon as it is committed
+
+    batch_size = batch_size or settings.INGEST_BATCH_SIZE
+    records = read_records(file, fmt)
+    number = 0
+
+    try:
+        while True:
+            batch = list(islice(records, batch_size))
+
+            if not batch:
+                break
+
+            number += 1
+            yield ingest_batch(db, number, batch, fmt, user_id)
+
+    except (csv.Error, UnicodeDecodeError) as e:
+        # the rest of the file cannot be read reliably, stop here
+        yield {
+            "batch": number + 1,
+            "rows": 0,
+            "inserted": 0,
+            "rejected": 0,
+            "errors": [{"line": 0, "detail": f"unreadable input: {e}"}],
+            "seconds": 0.0,
+        }
+
+    finally:
+        # new posts change every list and search page (post pages are unaffected)
+        cache.post_responses.invalidate_tag("posts")
+        cache.post_responses.invalidate_tag("posts:search")
+
+
+def ingest(db, file, fmt, user_id, batch_size=None):
+
+    # schemas.IngestReport for the whole file, only the per batch summaries are kept
+
+    started = time.perf_counter()
+    batches = list(ingest_batches(db, file, fmt, user_id, batch_size))
+    seconds = time.perf_counter() - started
+    inserted = sum(batch["inserted"] for batch in batches)
+
+    return {
+        "inserted": inserted,
+        "rejected": sum(batch["rejected"] for batch in batches),
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(inserted / seconds, 1) if seconds else 0.0,
+        "batches": batches,
+    }
+
+
+def ingest_file(file, fmt, user_id, batch_size=None):
+
+    # same as ingest() with a session of its own (async routes, the command line)
+
+    db = SessionLocal()
+
+    try:
+        return ingest(db, file, fmt, user_id, batch_size)
+    finally:
+        db.close()
+
+
+# -- Command Line --------------------------------------------------------------
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="bulk load posts for one user with postgres COPY")
+    parser.add_argument("path", help="ndjson or csv file")
+    parser.add_argument("--email", required=True, help="owner of the new posts")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="default: from the file extension")
+    parser.add_argument("--batch-size", type=int, default=settings.INGEST_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or detect_format(args.path)
+
+    if fmt is None:
+        parser.error("cannot tell the format from the extension, use --format")
+
+    create_engines()
+    db = SessionLocal()
+
+    try:
+        user = db.query(models.User.id).filter(models.User.email == args.email).first()
+
+        if user is None:
+            parser.error(f"user with email: {args.email} does not exist")
+
+        started = time.perf_counter()
+        inserted = rejected = 0
+
+        with open(args.path, "rb") as file:
+            for batch in ingest_batches(db, file, fmt, user.id, args.batch_size):
+                inserted += batch["inserted"]
+                rejected += batch["rejected"]
+
+                print(f"batch {batch['batch']}: {batch['inserted']} inserted, {batch['rejected']} rejected "
+                      f"in {batch['seconds']}s")
+
+                for error in batch["errors"]:
+                    print(f"  line {error['line']}: {error['detail']}")
+
+        seconds = time.perf_counter() - started
+        print(f"{inserted} post(s) inserted, {rejected} rejected, {inserted / seconds if seconds else 0:.0f} rows/s")
+
+    finally:
+        db.close()
+
+    return 1 if rejected else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,10 +1,10 @@
+import anyio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .database import engine
+from starlette.concurrency import run_in_threadpool
 from .config import settings
 
-from . import models
-from .routers import post, user, auth, vote
+from . import compression, database, metrics, profiling, replicas, utility
 
 
 # -- START OF CODE -------------------------------------------------------------
@@ -12,10 +12,21 @@ from .routers import post, user, auth, vote
 
 # command to tell sqlalchemy to run create statement to generate tables
 # can remove if using alembic
-# models.Base.metadata.create_all(bind=engine)
+# models.Base.metadata.create_all(bind=database.engine)
 
-# create app
-app = FastAPI()
+""" APP FACTORY
+
+create_app() builds the app: middleware, routers and the startup/shutdown handlers,
+app = create_app() below is what uvicorn / gunicorn load
+
+- importing this module does not touch the database: the engines are made by the
+startup handler, in each worker (after gunicorn --preload forks), then the pool is
+warmed up before the worker accepts requests (see database.py)
+- the routers are imported by create_app, the sync or async set depending on the settings
+- scripts and benchmarks can build a fresh app with create_app()
+- python -m bench imports checks how long importing this module takes
+
+"""
 
 """ Cross-Origin Resource Sharing (CORS)
 
@@ -38,25 +49,108 @@ origins = [
     "*"  # wildcard to allow every domain to access
 ]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],  # can limit by e.g. GET requests only
-    allow_headers=["*"],
-)
 
-# import router objects from files
+def create_app():
+
+    # create app
+    app = FastAPI()
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],  # can limit by e.g. GET requests only
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor"],  # readable by browser code, the next page of GET /posts
+    )
+
+    # clients that write read from the primary for a while (see replicas.py)
+    if settings.DATABASE_REPLICA_URLS:
+        app.add_middleware(replicas.PinToPrimaryMiddleware)
+
+    # Server-Timing / X-DB-Query-Count headers (see profiling.py)
+    if settings.SQL_TIMING:
+        app.add_middleware(profiling.SqlTimingMiddleware)
+
+    # gzip / brotli bodies, see compression.py
+    if settings.COMPRESSION_ENABLED:
+        app.add_middleware(compression.CompressionMiddleware)
+
+    # added last so it wraps the others: request timings for GET /metrics (see metrics.py)
+    if settings.METRICS_ENABLED:
+        app.add_middleware(metrics.MetricsMiddleware)
+
+    # import router objects from files
+    # async routers (asyncpg) or the default sync ones (psycopg2), same paths and schemas
+
+    if settings.DATABASE_ASYNC:
+        from .routers import post_async as post, user_async as user, auth_async as auth, vote_async as vote
+    else:
+        from .routers import post, user, auth, vote
+
+    from .routers import monitoring
+
+    app.include_router(post.router)
+    app.include_router(user.router)
+    app.include_router(auth.router)
+    app.include_router(vote.router)
+    app.include_router(monitoring.router)
+
+    app.add_event_handler("startup", open_database)
+    app.add_event_handler("startup", size_threadpool)
+    app.add_event_handler("shutdown", close_database)
+    app.add_event_handler("shutdown", stop_password_workers)
+
+    app.add_api_route("/", root, methods=["GET"])
+
+    return app
+
 
-app.include_router(post.router)
-app.include_router(user.router)
-app.include_router(auth.router)
-app.include_router(vote.router)
+# -- Startup -------------------------------------------------------------------
+
+async def open_database():
+
+    # engines for this worker, then the pooled connections, before the first request
+    database.create_engines()
+
+    # only the engines the routers use, in async mode the sync engine is for COPY (ingest.py)
+    if settings.DATABASE_ASYNC:
+        await database.warm_up_async_pools()
+    else:
+        await run_in_threadpool(database.warm_up_pools)
+
+
+def size_threadpool():
+
+    # sync routes hold a threadpool worker (default 40) for the whole request, with more
+    # threads than pooled connections the extra ones only wait on the pool (pool_timeout)
+    # one thread per connection keeps the waiting in anyio's queue instead
+
+    if not settings.DATABASE_ASYNC:
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        limiter.total_tokens = settings.DATABASE_POOL_SIZE + settings.DATABASE_MAX_OVERFLOW
+
+
+# -- Shutdown ------------------------------------------------------------------
+
+async def close_database():
+
+    if settings.DATABASE_ASYNC:
+        await database.dispose_async_engines()
+
+    database.dispose_engines()
+
+
+def stop_password_workers():
+
+    utility.shutdown_pwd_pool()
 
 
 # -- HTTP Requests -------------------------------------------------------------
 
-@app.get("/")
 def root():
 
     return {"msg": "welcome to the api (with sqlalchemy)"}
+
+
+app = create_app()
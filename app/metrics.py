@@ -0,0 +1,255 @@
+import bisect
+import threading
+import time
+from sqlalchemy import event
+
+""" METRICS
+
+GET /metrics in prometheus text format (https://prometheus.io/docs/instrumenting/exposition_formats/)
+
+    http_requests_in_flight                 requests being served right now
+    http_request_duration_seconds           histogram by method, route template and status
+    db_statement_duration_seconds           histogram by statement type (SELECT, INSERT, ...)
+    db_statement_errors_total               statements that raised
+    db_pool_*                               connection pool of the active engine (see pool.py)
+
+- MetricsMiddleware is a plain asgi middleware (no BaseHTTPMiddleware, no Request objects),
+the time covers the whole response, streamed bodies included
+- routes are labelled by their template (/posts/{id}), never the raw path, unmatched paths
+share one label, so the number of series stays bounded
+- observing costs a bisect and a dict lookup under a lock, buckets are cumulated at render time
+- numbers are per worker process, prometheus scrapes each worker (or sums them)
+
+"""
+
+CONTENT_TYPE = "text/plain; version=0.0.4"  # starlette appends the charset
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+STATEMENT_TYPES = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+
+def escape(value):
+
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+
+    return ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+# -- Metric Types --------------------------------------------------------------
+
+class Histogram:
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.lock = threading.Lock()  # sql events arrive from threadpool workers
+        self.series = {}  # label values -> [count per bucket (+Inf last), sum]
+
+    def observe(self, values, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)  # first bucket with le >= seconds
+
+        with self.lock:
+            series = self.series.get(values)
+
+            if series is None:
+                series = self.series[values] = [[0] * (len(self.buckets) + 1), 0.0]
+
+            series[0][index] += 1
+            series[1] += seconds
+
+    def render(self):
+        with self.lock:
+            snapshot = sorted((values, list(counts), total) for values, (counts, total) in self.series.items())
+
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+
+        for values, counts, total in snapshot:
+            labels = format_labels(self.labels, values)
+            cumulative = 0
+
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{labels},le="{le}"}} {cumulative}')
+
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+
+        return lines
+
+
+class Counter:
+
+    type = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}", f"{self.name} {self.value}"]
+
+
+class Gauge(Counter):
+
+    type = "gauge"  # inc(-1) to go down
+
+
+http_in_flight = Gauge("http_requests_in_flight", "Requests currently being served.")
+
+http_duration = Histogram(
+    "http_request_duration_seconds", "Time from request to the end of the response.",
+    ("method", "route", "status"), HTTP_BUCKETS
+)
+
+db_duration = Histogram(
+    "db_statement_duration_seconds", "Time spent executing sql statements.",
+    ("statement",), DB_BUCKETS
+)
+
+db_errors = Counter("db_statement_errors_total", "Sql statements that raised an error.")
+
+
+# -- Requests ------------------------------------------------------------------
+
+class MetricsMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+        self.route_paths = {}  # endpoint -> route template, filled on first use
+
+    def route(self, scope):
+
+        # the router stores the matched endpoint in the scope, map it back to its path template
+        endpoint = scope.get("endpoint")
+
+        if endpoint is None:
+            return "unmatched"
+
+        path = self.route_paths.get(endpoint)
+
+        if path is None:
+            self.route_paths = {
+                route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")
+            }
+            path = self.route_paths.get(endpoint, "unmatched")
+
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500  # unless a response is started, an exception became a 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+
+            await send(message)
+
+        http_in_flight.inc()
+        started = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_with_status)
+
+        finally:
+            http_in_flight.inc(-1)
+            http_duration.observe(
+                (scope["method"], self.route(scope), str(status_code)), time.perf_counter() - started
+            )
+
+
+# -- Database ------------------------------------------------------------------
+
+def statement_type(statement):
+
+    keyword = statement.lstrip()[:7].split(None, 1)[:1]
+    keyword = keyword[0].upper() if keyword else ""
+
+    return keyword if keyword in STATEMENT_TYPES else "OTHER"
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+
+    started = conn.info["metrics_started"].pop()
+    db_duration.observe((statement_type(statement),), time.perf_counter() - started)
+
+
+def handle_error(exception_context):
+
+    # after_cursor_execute is skipped when the statement raised
+    connection = exception_context.connection
+
+    if connection is not None and connection.info.get("metrics_started"):
+        connection.info["metrics_started"].pop()
+
+    db_errors.inc()
+
+
+def instrument_engine(engine):
+
+    # engine: a sync Engine (for an AsyncEngine pass async_engine.sync_engine)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+
+# -- Exposition ----------------------------------------------------------------
+
+POOL_METRICS = (
+    # pool_status key, metric, type, help
+    ("size", "db_pool_size", "gauge", "Connections kept open by the pool."),
+    ("checked_out", "db_pool_checked_out", "gauge", "Connections in use."),
+    ("checked_in", "db_pool_checked_in", "gauge", "Idle connections in the pool."),
+    ("overflow", "db_pool_overflow", "gauge", "Connections opened past the pool size."),
+    ("max_overflow", "db_pool_max_overflow", "gauge", "Overflow connections allowed."),
+    ("checkouts", "db_pool_checkouts_total", "counter", "Connections checked out."),
+    ("timeouts", "db_pool_timeouts_total", "counter", "Checkouts that gave up waiting for a connection."),
+)
+
+
+def render_pool(pool_status, wait_total):
+
+    lines = []
+
+    for key, name, type, help in POOL_METRICS:
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {type}", f"{name} {pool_status[key]}"]
+
+    name = "db_pool_checkout_wait_seconds_total"
+    lines += [f"# HELP {name} Time spent waiting for connections.", f"# TYPE {name} counter", f"{name} {wait_total}"]
+
+    return lines
+
+
+def render(pool_status=None, wait_total=0.0):
+
+    lines = http_in_flight.render() + http_duration.render() + db_duration.render() + db_errors.render()
+
+    if pool_status is not None:
+        lines += render_pool(pool_status, wait_total)
+
+    return "\n".join(lines) + "\n"
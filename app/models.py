@@ -1,7 +1,8 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String
+from sqlalchemy import Boolean, Column, Computed, ForeignKey, Index, Integer, String
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 from sqlalchemy.sql.expression import text
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 
 from .database import Base
 
@@ -37,12 +38,36 @@ class Post(Base):
     updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("current_timestamp"))
     user_id = Column(Integer, ForeignKey("users.id", ondelete="cascade"), nullable=False)  # foreign key
 
+    # denormalised count of votes, kept exact by routers/vote.py in the same transaction
+    # as the vote insert/delete (drift can be checked with: python -m app.reconcile)
+    vote_count = Column(Integer, nullable=False, server_default="0")
+
+    # full text search document, generated by postgres from title (weight A) and content (weight B)
+    # deferred so it is never loaded unless asked for, only used in WHERE/ORDER BY of searches
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed(
+            "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(content, '')), 'B')",
+            persisted=True
+        )
+    ))
+
     # relationship (of class) - fetches specific info from other tables
     # returns values from other tables related to this one
     # based on foreign key pointing to this record
 
     user = relationship("User")
 
+    # indexes (created through alembic, declared here so autogenerate keeps them)
+
+    __table_args__ = (
+        Index("ix_posts_created_at_id", "created_at", "id"),  # keyset pagination
+        Index("ix_posts_search_vector", "search_vector", postgresql_using="gin"),  # full text search
+        Index("ix_posts_user_id", "user_id"),  # posts of a user, cascade deletes
+        Index("ix_posts_vote_count_id", "vote_count", "id"),  # GET /posts/top
+    )
+
 
 class User(Base):
 
@@ -61,3 +86,9 @@ class Vote(Base):
     # both columns are primary key with foreign keys of 2 tables
     user_id = Column(Integer, ForeignKey("users.id", ondelete="cascade"), primary_key=True, nullable=False)
     post_id = Column(Integer, ForeignKey("posts.id", ondelete="cascade"), primary_key=True)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text("current_timestamp"))
+
+    __table_args__ = (
+        Index("ix_votes_created_at", "created_at"),  # recent votes, GET /posts/trending
+        Index("ix_votes_user_id", "user_id"),  # votes of a user, cascade deletes
+    )
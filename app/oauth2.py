@@ -1,12 +1,14 @@
 from fastapi import Depends, status
 from fastapi.exceptions import HTTPException
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
 from datetime import datetime, timedelta
 
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from .cache import LRUCache
 from .config import settings
-from .database import get_db
+from .database import get_db, get_async_db
 from . import schemas, models
 
 """ JWT TOKEN AUTHENTICATION
@@ -51,8 +53,55 @@ ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 
+""" AUTHENTICATED USER CACHE
+
+- every protected request used to look up the token's user in the users table
+- verified users are kept in memory by id (schemas.UserOut, detached from any session)
+- a changed or deleted user is evicted when the change is flushed and again on commit
+(the second catches a request that re-cached the old row in between)
+- bulk query().update()/delete() on users cannot tell which ids changed, clears it all
+
+"""
+
+user_cache = LRUCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL_SECONDS)
+
+
+@event.listens_for(Session, "after_flush")
+def evict_flushed_users(session, flush_context):
+
+    changed = {user.id for user in session.dirty | session.deleted if isinstance(user, models.User)}
+
+    for id in changed:
+        user_cache.invalidate(id)
+
+    session.info.setdefault("changed_users", set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def evict_committed_users(session):
+
+    for id in session.info.pop("changed_users", ()):
+        user_cache.invalidate(id)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_changed_users(session):
+
+    session.info.pop("changed_users", None)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def clear_on_bulk_user_change(orm_execute_state):
+
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) \
+            and orm_execute_state.bind_mapper is models.User.__mapper__:
+        user_cache.clear()
+
+
 def create_access_token(data: dict):
 
+    from jose import jwt  # imported on first use, like passlib (see utility.py)
+
     # make copy of original data
     to_encode = data.copy()
 
@@ -66,6 +115,8 @@ def verify_access_token(token: str, credentials_exception):
 
     # if no error, then authenticated successfully
 
+    from jose import JWTError, jwt
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
 
@@ -101,6 +152,43 @@ def get_current_user(
     # will verify access token and return the verified user
 
     token = verify_access_token(token, credentials_exception)
-    user = db.query(models.User).filter(models.User.id == token.id).first()
+    user = user_cache.get(token.id)
+
+    if user is None:
+        found_user = db.query(models.User).filter(models.User.id == token.id).first()
+
+        if found_user is None:  # valid token of a deleted user
+            raise credentials_exception
+
+        user = schemas.UserOut.from_orm(found_user)
+        user_cache.set(token.id, user)
+
+    return user
+
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
+
+    # same as get_current_user, for the async routers
+
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=f"Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"}
+    )
+
+    token = verify_access_token(token, credentials_exception)
+    user = user_cache.get(token.id)
+
+    if user is None:
+        found_user = (await db.execute(select(models.User).filter(models.User.id == token.id))).scalars().first()
+
+        if found_user is None:  # valid token of a deleted user
+            raise credentials_exception
+
+        user = schemas.UserOut.from_orm(found_user)
+        user_cache.set(token.id, user)
 
     return user
@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+""" CONNECTION POOL
+
+https://docs.sqlalchemy.org/en/14/core/pooling.html
+
+- every request checks a connection out of the pool for the length of its session
+- pool_size connections are kept open, max_overflow more are opened under load
+- when all are checked out, requests wait up to pool_timeout seconds, then error
+- pool_recycle: reconnect connections older than n seconds (idle timeouts, failovers)
+- pool_pre_ping: test the connection on checkout, drops dead ones instead of failing the request
+
+workers * (pool_size + max_overflow) must stay below postgres max_connections,
+GET /pool shows how close each worker gets and how long requests wait.
+
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+
+    # counters for one pool, updated on every checkout
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited: float):
+        with self.lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+
+class TimedPoolMixin:
+
+    # times connect() (waiting for a free connection, opening an overflow one and pre-ping)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def connect(self):
+        start = time.perf_counter()
+
+        try:
+            return super().connect()
+
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            logger.warning("connection pool exhausted: %s", pool_status(self))
+            raise
+
+        finally:
+            self.stats.record(time.perf_counter() - start)
+
+    def recreate(self):
+        # engine.dispose() swaps in a new pool, keep counting into the same stats
+        pool = super().recreate()
+        pool.stats = self.stats
+
+        return pool
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def pool_options(settings):
+
+    # create_engine / create_async_engine keyword arguments from config.Settings
+
+    return {
+        "pool_size": settings.DATABASE_POOL_SIZE,
+        "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+        "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+        "pool_recycle": settings.DATABASE_POOL_RECYCLE,
+        "pool_pre_ping": settings.DATABASE_POOL_PRE_PING,
+    }
+
+
+def pool_status(pool):
+
+    stats = pool.stats
+
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),  # negative until the pool is filled
+        "max_overflow": pool._max_overflow,
+        "checkouts": stats.checkouts,
+        "timeouts": stats.timeouts,
+        "wait_avg_ms": round(1000 * stats.wait_total / stats.checkouts, 3) if stats.checkouts else 0.0,
+        "wait_max_ms": round(1000 * stats.wait_max, 3),
+    }
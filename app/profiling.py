@@ -0,0 +1,158 @@
+import logging
+import re
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+from .config import settings
+from .metrics import statement_type
+
+""" SQL TIMING (settings.SQL_TIMING)
+
+every response gets the statements its request ran, e.g. for GET /posts:
+
+    X-DB-Query-Count: 2
+    Server-Timing: db;dur=3.1;desc="2 queries", q1;dur=0.4;desc="SELECT users",
+                   q2;dur=2.7;desc="SELECT posts", app;dur=9.8
+
+- app is the whole request up to the response headers, app - db is python (auth, serialization)
+- browsers show Server-Timing in the network tab (timing), curl -i shows it too
+- statements slower than SLOW_QUERY_MS are logged with their sql, parameters and EXPLAIN plan,
+the plan comes from a second cursor on the same connection inside a savepoint (a failing
+EXPLAIN cannot break the request's transaction), plain EXPLAIN never runs the statement
+- statements are collected in a contextvar, set per request by the middleware and copied
+into the threadpool with the rest of the context (sync routes, get_db)
+- streamed responses (/export) send their headers before most of their statements run
+
+"""
+
+logger = logging.getLogger(__name__)
+
+MAX_TIMED_STATEMENTS = 10  # per statement entries in Server-Timing, the total covers all
+
+TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+(\w+)", re.IGNORECASE)
+
+# (seconds, statement) of every statement run by the current request, None outside requests
+request_statements = ContextVar("request_statements", default=None)
+
+
+def statement_label(statement):
+
+    # "SELECT posts": statement type and the first table it touches
+    table = TABLE.search(statement)
+
+    return f"{statement_type(statement)} {table.group(1)}" if table else statement_type(statement)
+
+
+def server_timing(statements, total):
+
+    entries = [f'db;dur={1000 * sum(seconds for seconds, _ in statements):.1f};desc="{len(statements)} queries"']
+
+    for number, (seconds, statement) in enumerate(statements[:MAX_TIMED_STATEMENTS], start=1):
+        entries.append(f'q{number};dur={1000 * seconds:.1f};desc="{statement_label(statement)}"')
+
+    entries.append(f"app;dur={1000 * total:.1f}")
+
+    return ", ".join(entries)
+
+
+# -- Requests ------------------------------------------------------------------
+
+class SqlTimingMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        statements = []
+        token = request_statements.set(statements)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("X-DB-Query-Count", str(len(statements)))
+                headers.append("Server-Timing", server_timing(statements, time.perf_counter() - started))
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_statements.reset(token)
+
+
+# -- Database ------------------------------------------------------------------
+
+def explain(conn, statement, parameters):
+
+    cursor = conn.connection.cursor()  # dbapi cursor, not seen by the engine's events
+
+    try:
+        cursor.execute("SAVEPOINT slow_query_explain")
+
+        try:
+            cursor.execute("EXPLAIN " + statement, parameters)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            plan = f"EXPLAIN failed: {e}"
+
+    except Exception as e:  # no transaction to hold a savepoint
+        plan = f"EXPLAIN not available: {e}"
+
+    finally:
+        cursor.close()
+
+    return plan
+
+
+def log_slow_query(conn, statement, parameters, executemany, seconds):
+
+    plan = "(executemany, not explained)" if executemany else explain(conn, statement, parameters)
+
+    logger.warning(
+        "slow query (%.1f ms):\n%s\nparameters: %r\n%s",
+        1000 * seconds, statement, parameters, plan
+    )
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+
+    conn.info.setdefault("profiling_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+
+    seconds = time.perf_counter() - conn.info["profiling_started"].pop()
+    statements = request_statements.get()
+
+    if statements is not None:
+        statements.append((seconds, statement))
+
+    if settings.SLOW_QUERY_MS and seconds * 1000 >= settings.SLOW_QUERY_MS:
+        log_slow_query(conn, statement, parameters, executemany, seconds)
+
+
+def handle_error(exception_context):
+
+    connection = exception_context.connection
+
+    if connection is not None and connection.info.get("profiling_started"):
+        connection.info["profiling_started"].pop()
+
+
+def instrument_engine(engine):
+
+    # engine: a sync Engine (for an AsyncEngine pass async_engine.sync_engine)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
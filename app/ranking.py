@@ -0,0 +1,235 @@
+import bisect
+import math
+import threading
+import time
+from datetime import timedelta
+from sqlalchemy import func, select
+
+from .config import settings
+from . import models
+
+""" POST RANKINGS
+
+GET /posts/top and /posts/trending read the best posts from memory, O(limit), instead of
+sorting every post (or aggregating every vote) per request
+
+    top         most votes first (posts.vote_count), exact
+    trending    votes weighted by age: a vote counts 1 when cast, 1/2 after TRENDING_HALF_LIFE_HOURS,
+                1/4 after twice that, ...
+
+- each ranking keeps its best RANKING_SIZE posts in a sorted list (+ a dict for lookups)
+- routers/vote.py feeds every committed vote in, with the vote_count returned by its update
+- loaded from the database on first use and every RANKING_REFRESH_SECONDS after that, which
+also brings in votes made through other workers
+- top stays exact with posts outside the list: floor is an upper bound on every post
+that is not in it, only posts at or above the floor are answered from memory, when
+there are not enough of those the ranking is reloaded
+- trending scores are stored relative to an epoch: a vote at time t adds 2 ** ((t - epoch) / half life),
+older scores never need to be decayed, the order is the same. the epoch moves on every load, and
+in record() once it is TRENDING_REBASE_HALF_LIVES old (scores scaled down to the new epoch), so
+the weight never overflows when nobody reads /posts/trending for months
+- only posts with votes are ranked
+
+"""
+
+TRENDING_WINDOW_HALF_LIVES = 8  # older votes weigh less than 1/256, not loaded
+
+TRENDING_REBASE_HALF_LIVES = 64  # weights stay below 2 ** 64, far from the float limit (2 ** 1024)
+
+
+class Ranking:
+
+    # post id -> score, and the posts sorted best first as (-score, -id) (newest first on ties)
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.RLock()  # votes arrive from threadpool workers
+        self.scores = {}
+        self.order = []
+        self.loaded_at = None
+
+    def key(self, post_id):
+        return (-self.scores[post_id], -post_id)
+
+    def set_score(self, post_id, score):
+        # lock held
+        if post_id in self.scores:
+            self.order.pop(bisect.bisect_left(self.order, self.key(post_id)))
+
+        self.scores[post_id] = score
+        bisect.insort(self.order, self.key(post_id))
+
+    def evict(self):
+        # lock held, drops the last post, returns its (score, id)
+        score, post_id = self.order.pop()
+        del self.scores[-post_id]
+
+        return -score, -post_id
+
+    def discard(self, post_id):
+        with self.lock:
+            if post_id in self.scores:
+                self.order.pop(bisect.bisect_left(self.order, self.key(post_id)))
+                del self.scores[post_id]
+
+    def load(self, rows):
+        # rows: (post id, score), best first, at most size
+        with self.lock:
+            self.scores = {post_id: score for post_id, score in rows}
+            self.order = sorted((-score, -post_id) for post_id, score in rows)
+            self.loaded_at = time.monotonic()
+
+    def is_stale(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > settings.RANKING_REFRESH_SECONDS
+
+    def best(self, limit):
+        # lock held
+        return self.order[:max(0, min(limit, self.size))]
+
+
+class TopPosts(Ranking):
+
+    def __init__(self, size):
+        super().__init__(size)
+        self.floor = (0, math.inf)  # (votes, id) above every post not in the ranking
+
+    def load(self, rows):
+        with self.lock:
+            super().load(rows)
+            self.floor = (0, math.inf)
+
+            if len(rows) == self.size:  # posts were left out, none of them above the last one loaded
+                self.floor = max(self.floor, (rows[-1][1], rows[-1][0]))
+
+    def record(self, post_id, votes):
+        with self.lock:
+            if post_id in self.scores or (votes, post_id) > self.floor:
+                self.set_score(post_id, votes)
+
+                if len(self.scores) > self.size:
+                    self.floor = max(self.floor, self.evict())
+
+            # otherwise it moved by one vote and is still below the floor
+
+    def read(self, limit, check_stale=True):
+
+        # post ids best first, None when memory cannot answer exactly (reload, then read again)
+
+        limit = min(limit, self.size)  # never more than the ranking holds, or it would never be exact
+
+        with self.lock:
+            if check_stale and self.is_stale():
+                return None
+
+            best = self.best(limit)
+            floor = (-self.floor[0], -self.floor[1])
+            ids = [-post_id for score, post_id in best if (score, post_id) <= floor]
+
+            if len(ids) < len(best) or (len(ids) < limit and self.floor[0] > 0):
+                # posts with votes were left out of the ranking and could be better than these
+                return None if check_stale else ids
+
+            return ids
+
+
+class TrendingPosts(Ranking):
+
+    def __init__(self, size):
+        super().__init__(size)
+        self.half_life = settings.TRENDING_HALF_LIFE_HOURS * 3600
+        self.epoch = time.time()
+
+    def weight(self, at):
+        return 2 ** ((at - self.epoch) / self.half_life)
+
+    def rebase(self, at):
+        # lock held, scores relative to at instead of the old epoch, same order
+        # (a score too small for a float becomes 0 and leaves the ranking)
+        factor = 2 ** -((at - self.epoch) / self.half_life)
+
+        self.scores = {post_id: score * factor for post_id, score in self.scores.items() if score * factor > 0}
+        self.order = sorted((-score, -post_id) for post_id, score in self.scores.items())
+        self.epoch = at
+
+    def load(self, rows):
+        # rows: (post id, decayed score now), stored relative to now
+        with self.lock:
+            self.epoch = time.time()
+            super().load(rows)
+
+    def record(self, post_id, dir):
+        with self.lock:
+            now = time.time()
+
+            if now - self.epoch > TRENDING_REBASE_HALF_LIVES * self.half_life:
+                self.rebase(now)
+
+            weight = self.weight(now)
+
+            if dir == 1:
+                self.set_score(post_id, self.scores.get(post_id, 0.0) + weight)
+
+                if len(self.scores) > self.size:
+                    self.evict()
+
+            elif post_id in self.scores:
+                # the vote's own weight is unknown here, take off a current one (exact for like then unlike),
+                # the next load recomputes it from votes.created_at
+                score = self.scores[post_id] - weight
+
+                if score > 0:
+                    self.set_score(post_id, score)
+                else:
+                    self.discard(post_id)  # no votes left to weigh, only posts with votes are ranked
+
+    def read(self, limit, check_stale=True):
+        with self.lock:
+            if check_stale and self.is_stale():
+                return None
+
+            return [-post_id for score, post_id in self.best(limit)]
+
+
+top_posts = TopPosts(settings.RANKING_SIZE)
+trending_posts = TrendingPosts(settings.RANKING_SIZE)
+
+
+# -- Loading -------------------------------------------------------------------
+
+def top_query():
+
+    # (post id, vote_count) of the best RANKING_SIZE posts
+    return select(models.Post.id, models.Post.vote_count) \
+        .filter(models.Post.vote_count > 0) \
+        .order_by(models.Post.vote_count.desc(), models.Post.id.desc()) \
+        .limit(settings.RANKING_SIZE)
+
+
+def trending_query():
+
+    # (post id, sum of 0.5 ** (age / half life)) over the recent votes, best RANKING_SIZE posts
+
+    half_life = timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS)
+    age = func.extract("epoch", func.now() - models.Vote.created_at)
+    score = func.sum(func.power(0.5, age / half_life.total_seconds()))
+
+    return select(models.Vote.post_id, score) \
+        .filter(models.Vote.created_at > func.now() - TRENDING_WINDOW_HALF_LIVES * half_life) \
+        .group_by(models.Vote.post_id) \
+        .order_by(score.desc(), models.Vote.post_id.desc()) \
+        .limit(settings.RANKING_SIZE)
+
+
+# -- Updates -------------------------------------------------------------------
+
+def record_vote(post_id, votes, dir):
+
+    # after a committed vote, votes: the post's new vote_count
+    top_posts.record(post_id, votes)
+    trending_posts.record(post_id, dir)
+
+
+def remove_post(post_id):
+
+    top_posts.discard(post_id)
+    trending_posts.discard(post_id)
@@ -0,0 +1,83 @@
+import argparse
+from sqlalchemy import func, select
+
+from .database import SessionLocal, create_engines
+from . import models
+
+""" VOTE COUNT RECONCILIATION
+
+posts.vote_count is a denormalised copy of count(votes) per post, maintained by
+routers/vote.py in the same transaction as every vote insert/delete.
+
+Anything that writes votes behind the api's back (manual sql, restores) can make
+it drift, this command compares it against the votes table and repairs it.
+
+commands:
+
+    python -m app.reconcile          report posts whose vote_count has drifted
+    python -m app.reconcile --fix    report and repair them
+
+"""
+
+
+def actual_votes():
+
+    # correlated count of votes for the outer posts row
+    return select(func.count(models.Vote.post_id)) \
+        .where(models.Vote.post_id == models.Post.id) \
+        .scalar_subquery()
+
+
+def find_drift(db):
+
+    # returns [(post_id, stored vote_count, actual count)]
+    votes = actual_votes()
+
+    return db.query(models.Post.id, models.Post.vote_count, votes) \
+        .filter(models.Post.vote_count != votes) \
+        .order_by(models.Post.id) \
+        .all()
+
+
+def repair_drift(db):
+
+    # single update, only touches posts that are actually wrong
+    votes = actual_votes()
+
+    repaired = db.query(models.Post) \
+        .filter(models.Post.vote_count != votes) \
+        .update({models.Post.vote_count: votes}, synchronize_session=False)
+
+    db.commit()
+
+    return repaired
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="check posts.vote_count against the votes table")
+    parser.add_argument("--fix", action="store_true", help="repair drifted posts")
+    args = parser.parse_args(argv)
+
+    create_engines()
+    db = SessionLocal()
+
+    try:
+        drift = find_drift(db)
+
+        for post_id, stored, actual in drift:
+            print(f"post {post_id}: vote_count={stored} actual={actual}")
+
+        print(f"{len(drift)} post(s) drifted")
+
+        if args.fix and drift:
+            print(f"{repair_drift(db)} post(s) repaired")
+
+    finally:
+        db.close()
+
+    return 1 if drift and not args.fix else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,61 @@
+from starlette.datastructures import Headers, MutableHeaders
+
+from .cache import LRUCache
+from .config import settings
+
+""" PIN TO PRIMARY
+
+replicas apply the primary's writes a little later (replication lag), a client that
+reads right after its own write could get the old row back from a replica
+
+- every successful write (POST, PUT, PATCH, DELETE under 400) pins its client to the
+primary for DATABASE_PRIMARY_PIN_SECONDS, database.get_read_db then skips the replicas
+- pinned in two places:
+    cookie        read_primary (Max-Age = pin seconds), seen by every worker, browsers
+    in process    the client's bearer token (or address), for clients that drop cookies
+- the response cache is not pinned: a page cached from a replica can trail the primary
+by the replication lag on top of its ttl (writes in this worker still invalidate it)
+
+"""
+
+PIN_COOKIE = "read_primary"
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+pinned_clients = LRUCache(10000, settings.DATABASE_PRIMARY_PIN_SECONDS)
+
+
+def client_key(headers, client):
+
+    # the bearer token when there is one (one per logged in user), else the client address
+    return headers.get("authorization") or (client[0] if client else "")
+
+
+def is_pinned(request):
+
+    return PIN_COOKIE in request.cookies or \
+        pinned_clients.get(client_key(request.headers, request.client)) is not None
+
+
+class PinToPrimaryMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_pin(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                pinned_clients.set(client_key(Headers(scope=scope), scope.get("client")), True)
+
+                MutableHeaders(scope=message).append(
+                    "Set-Cookie",
+                    f"{PIN_COOKIE}=1; Max-Age={settings.DATABASE_PRIMARY_PIN_SECONDS}; Path=/; HttpOnly; SameSite=Lax"
+                )
+
+            await send(message)
+
+        await self.app(scope, receive, send_with_pin)
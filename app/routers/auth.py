@@ -1,9 +1,10 @@
 from fastapi import Depends, status, HTTPException, Response, APIRouter
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from ..database import get_db
-from .. import schemas, models, utility, oauth2
+from .. import schemas, models, utility, oauth2, throttle
 
 # router can create a prefix
 router = APIRouter(
@@ -21,18 +22,40 @@ API -> dB : find user by email
 API <- dB : user {password(hashed)}
 API : takes input password, hashes it and check against hashed password
 Client <- API : {token}
+
+- async def: bcrypt (~250ms) is awaited in the password worker processes, not waited on
+by a threadpool thread (the threadpool is as small as the connection pool, see main.py)
+- the user lookup runs in the threadpool and closes the session before bcrypt starts,
+the pooled connection is not held for the whole verification
 """
 
 
-@ router.post("/", response_model=schemas.Token)
-def login(
+def find_user(db: Session, email):
+
+    # returns the user (detached, loaded columns stay readable) and gives the connection back
+    try:
+        return db.query(models.User).filter(models.User.email == email).first()
+    finally:
+        db.close()
+
+
+def save_password_hash(db: Session, user_id, new_hash):
+
+    db.query(models.User) \
+        .filter(models.User.id == user_id) \
+        .update({models.User.password: new_hash}, synchronize_session=False)
+    db.commit()
+
+
+@ router.post("/", response_model=schemas.Token, dependencies=[Depends(throttle.limit_login)])  # 429 before any lookup
+async def login(
     user_credentials: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
 
     # returns username & password which are submitted via form data
 
-    user = db.query(models.User).filter(models.User.email == user_credentials.username).first()
+    user = await run_in_threadpool(find_user, db, user_credentials.username)
 
     if user is None:
         raise HTTPException(
@@ -40,12 +63,18 @@ def login(
             detail=f"Invalid Credentials"
         )
 
-    if utility.verify_pwd(user_credentials.password, user.password) is False:
+    # bcrypt runs in the password worker processes (see utility.py)
+    valid, new_hash = await utility.verify_and_update_pwd_async(user_credentials.password, user.password)
+
+    if valid is False:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=f"Invalid Credentials"
         )
 
+    if new_hash is not None:  # stored hash used an outdated cost factor
+        await run_in_threadpool(save_password_hash, db, user.id, new_hash)
+
     # return token
 
     access_token = oauth2.create_access_token(data={"user_id": user.id})
@@ -0,0 +1,52 @@
+from fastapi import Depends, status, HTTPException, APIRouter
+from fastapi.security.oauth2 import OAuth2PasswordRequestForm
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import get_async_db
+from .. import schemas, models, utility, oauth2, throttle
+
+# async def version of routers/auth.py, mounted instead of it when settings.DATABASE_ASYNC is on
+
+router = APIRouter(
+    prefix="/login",  # for the path
+    tags=["Authentication"]  # grouping in doc by category
+)
+
+
+# -- Authentication Requests ---------------------------------------------------
+
+@ router.post("/", response_model=schemas.Token, dependencies=[Depends(throttle.limit_login)])  # 429 before any lookup
+async def login(
+    user_credentials: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_async_db)
+):
+
+    user = (await db.execute(
+        select(models.User).filter(models.User.email == user_credentials.username)
+    )).scalars().first()
+
+    await db.close()  # connection back to the pool before bcrypt, the user's columns stay loaded
+
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Invalid Credentials"
+        )
+
+    # bcrypt runs in the password worker processes (see utility.py)
+    valid, new_hash = await utility.verify_and_update_pwd_async(user_credentials.password, user.password)
+
+    if valid is False:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Invalid Credentials"
+        )
+
+    if new_hash is not None:  # stored hash used an outdated cost factor
+        await db.execute(update(models.User).filter(models.User.id == user.id).values(password=new_hash))
+        await db.commit()
+
+    access_token = oauth2.create_access_token(data={"user_id": user.id})
+
+    return {"access_token": access_token, "token_type": "bearer"}
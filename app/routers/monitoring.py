@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Response
+
+from .. import cache, database, metrics, oauth2, pool
+
+# router can create a prefix
+router = APIRouter(
+    tags=["Monitoring"]  # grouping in doc by category
+)
+
+
+def active_engine():
+
+    # the engine the routers use
+    return database.async_engine.sync_engine if database.async_engine is not None else database.engine
+
+
+# -- Monitoring Requests -------------------------------------------------------
+
+@ router.get("/pool")
+def get_pool_status():
+
+    # connection pool of this worker: checked out connections, overflow and checkout wait times
+
+    return pool.pool_status(active_engine().pool)
+
+
+@ router.get("/cache")
+def get_cache_status():
+
+    # in-process caches of this worker: size and hit/miss counters
+
+    return {
+        "users": oauth2.user_cache.stats(),
+        "post_responses": cache.post_responses.stats(),
+    }
+
+
+@ router.get("/metrics", response_class=Response)
+def get_metrics():
+
+    # prometheus text format, see metrics.py
+
+    engine_pool = active_engine().pool
+
+    return Response(
+        content=metrics.render(pool.pool_status(engine_pool), engine_pool.stats.wait_total),
+        media_type=metrics.CONTENT_TYPE
+    )
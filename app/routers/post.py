@@ -1,11 +1,13 @@
-from fastapi import Depends, status, HTTPException, Response, APIRouter
-from sqlalchemy.orm import Session
+from fastapi import Depends, File, Query, status, HTTPException, Request, Response, UploadFile, APIRouter
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.sql.expression import text
-from sqlalchemy import func
+from sqlalchemy import delete, func, select, tuple_, update
 from typing import Optional, List
 
-from ..database import get_db
-from .. import schemas, models, oauth2
+from ..database import get_db, get_read_db
+from .. import schemas, models, oauth2, utility, cache, serializers, ingest, ranking
+from ..config import settings
 
 # router can create a prefix
 router = APIRouter(
@@ -14,51 +16,283 @@ router = APIRouter(
 )
 
 
+# -- Query Helpers -------------------------------------------------------------
+# shared with routers/post_async.py, work on both a Query and a select()
+
+def filter_posts(posts_query, search, cursor, offset):
+
+    if search:
+        # full text search on the gin indexed search_vector, best matches first
+        # websearch_to_tsquery accepts free text ("quoted phrase", -exclude, or) without syntax errors
+
+        if cursor:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"cursor cannot be combined with search, use offset"
+            )
+
+        search_query = func.websearch_to_tsquery("english", search)
+
+        posts_query = posts_query \
+            .filter(models.Post.search_vector.op("@@")(search_query)) \
+            .order_by(func.ts_rank(models.Post.search_vector, search_query).desc(), models.Post.id.desc())
+
+    else:
+        # newest first, (created_at, id) is unique so the order is stable between pages
+        posts_query = posts_query.order_by(models.Post.created_at.desc(), models.Post.id.desc())
+
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = utility.decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+        posts_query = posts_query.filter(
+            tuple_(models.Post.created_at, models.Post.id) < (cursor_created_at, cursor_id)
+        )
+
+    elif offset:
+        posts_query = posts_query.offset(offset)  # kept for backward compatibility
+
+    return posts_query
+
+
+def next_cursor_headers(posts, limit, search):
+
+    # a full page means there may be more, hand back where this page stopped
+
+    if posts and len(posts) == limit and not search:
+        last_post = posts[-1].Post
+        return {"X-Next-Cursor": utility.encode_cursor(last_post.created_at, last_post.id)}
+
+    return {}
+
+
+""" OWNED POST MUTATIONS
+
+- ownership is part of the WHERE clause: id = :id AND user_id = :current_user
+- the updated row comes back from RETURNING, no select before or after
+- only when nothing matched, one lookup tells a missing post (404) from someone else's (403)
+
+"""
+
+POST_COLUMNS = (
+    models.Post.id, models.Post.title, models.Post.content, models.Post.published,
+    models.Post.user_id, models.Post.created_at, models.Post.updated_at
+)
+
+
+def update_own_post(id, user_id, post):
+
+    return update(models.Post) \
+        .filter(models.Post.id == id, models.Post.user_id == user_id) \
+        .values(post.dict() | {"updated_at": text("current_timestamp")}) \
+        .returning(*POST_COLUMNS) \
+        .execution_options(synchronize_session=False)
+
+
+def delete_own_post(id, user_id):
+
+    return delete(models.Post) \
+        .filter(models.Post.id == id, models.Post.user_id == user_id) \
+        .returning(models.Post.id) \
+        .execution_options(synchronize_session=False)
+
+
+def not_found_or_forbidden(id, found_post):
+
+    if found_post is None:  # check if post exist
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"post with id: {id} does not exist"
+        )
+
+    return HTTPException(  # post exists but the user does not own it
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail=f"Not authorised to perform requested action"
+    )
+
+
+def cache_posts(key, posts, limit, search):
+
+    # serialize a page once, tagged with every post on it (see cache.py)
+
+    cached = cache.make_cached_response(
+        serializers.render_posts(posts),
+        headers=next_cursor_headers(posts, limit, search)
+    )
+
+    tags = ["posts", *(f"post:{post.Post.id}" for post in posts)]
+
+    if search:
+        tags.append("posts:search")
+
+    cache.post_responses.set(key, cached, tags)
+
+    return cached
+
+
+def cache_post(key, post):
+
+    cached = cache.make_cached_response(serializers.render_post(post))
+    cache.post_responses.set(key, cached, [f"post:{post.Post.id}"])
+
+    return cached
+
+
+def export_posts():
+
+    # every post with its author, oldest first
+    # yield_per: rows come from a server side cursor in batches, never the whole table in memory
+    return select(models.Post) \
+        .options(joinedload(models.Post.user)) \
+        .order_by(models.Post.id) \
+        .execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+
+
+def ranked_posts(ids):
+
+    # the posts of a ranking (see ranking.py) with their authors, in any order
+    return select(models.Post, models.Post.vote_count.label("votes")) \
+        .options(joinedload(models.Post.user)) \
+        .filter(models.Post.id.in_(ids))
+
+
+def ranked_posts_response(posts, ids):
+
+    # back in ranking order, posts deleted since the ranking was loaded are skipped
+    posts_by_id = {post.Post.id: post for post in posts}
+
+    return Response(
+        content=serializers.render_posts([posts_by_id[id] for id in ids if id in posts_by_id]),
+        media_type="application/json"
+    )
+
+
+def upload_format(file: UploadFile):
+
+    fmt = ingest.detect_format(file.filename, file.content_type)
+
+    if fmt is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"upload a .csv or .ndjson file"
+        )
+
+    return fmt
+
+
 # -- Post Requests -------------------------------------------------------------
 
 @ router.get("/", response_model=List[schemas.PostVote])
 def get_all_posts(
-    db: Session = Depends(get_db),
+    request: Request,
+    db: Session = Depends(get_read_db),
     current_user: object = Depends(oauth2.get_current_user),  # create dependency
-    limit: int = 10,  # for query parameter
-    offset: int = 0,  # related to pagination
-    search: Optional[str] = ""  # for query parameters
+    limit: int = Query(10, ge=1, le=settings.POSTS_MAX_LIMIT),  # for query parameter, bounded: pages are cached
+    offset: int = Query(0, ge=0),  # related to pagination (deprecated, use cursor)
+    search: Optional[str] = "",  # for query parameters
+    cursor: Optional[str] = None  # X-Next-Cursor of the previous page
 ):
 
     # need to specify list of posts, using typing(List)
-    # join to get group by of count of votes
+    # votes read from the denormalised posts.vote_count (no join/group by on votes)
+    # pages are served from the response cache until a write touches them
 
-    posts = db.query(
-        models.Post,
-        func.count(models.Vote.post_id).label("votes")
-    ) \
-        .join(models.Vote, models.Vote.post_id == models.Post.id, isouter=True) \
-        .group_by(models.Post.id) \
-        .filter(models.Post.title.contains(search)) \
-        .limit(limit) \
-        .offset(offset) \
-        .all()
+    key = cache.request_key(request)
+    cached = cache.post_responses.get(key)
+
+    if cached is None:
+        # authors joined in the same select, PostOut.user would otherwise lazy load one by one
+
+        posts_query = db.query(
+            models.Post,
+            models.Post.vote_count.label("votes")
+        ) \
+            .options(joinedload(models.Post.user))
+
+        posts = filter_posts(posts_query, search, cursor, offset).limit(limit).all()
+        cached = cache_posts(key, posts, limit, search)
 
     # only filter by logged in user post
     # posts = db.query(models.Post).filter(models.Post.user_id == current_user.id).all()
 
-    return posts
+    return cache.cached_json_response(request, cached)
+
+
+@ router.get("/top", response_model=List[schemas.PostVote])  # before /{id}
+def get_top_posts(
+    db: Session = Depends(get_read_db),
+    current_user: object = Depends(oauth2.get_current_user),  # create dependency
+    limit: int = Query(10, ge=1, le=settings.RANKING_SIZE)  # the ranking holds no more
+):
+
+    # most voted posts first, ids from the in-memory ranking, one query for the posts
+
+    ids = ranking.top_posts.read(limit)
+
+    if ids is None:  # not loaded yet, stale, or not exact anymore
+        ranking.top_posts.load(db.execute(ranking.top_query()).all())
+        ids = ranking.top_posts.read(limit, check_stale=False)
+
+    return ranked_posts_response(db.execute(ranked_posts(ids)).all() if ids else [], ids)
+
+
+@ router.get("/trending", response_model=List[schemas.PostVote])  # before /{id}
+def get_trending_posts(
+    db: Session = Depends(get_read_db),
+    current_user: object = Depends(oauth2.get_current_user),  # create dependency
+    limit: int = Query(10, ge=1, le=settings.RANKING_SIZE)  # the ranking holds no more
+):
+
+    # posts with the most recent votes first (see ranking.py)
+
+    ids = ranking.trending_posts.read(limit)
+
+    if ids is None:
+        ranking.trending_posts.load(db.execute(ranking.trending_query()).all())
+        ids = ranking.trending_posts.read(limit, check_stale=False)
+
+    return ranked_posts_response(db.execute(ranked_posts(ids)).all() if ids else [], ids)
+
+
+@ router.get("/export", response_class=StreamingResponse)  # before /{id}, or "export" is parsed as an id
+def export_all_posts(
+    db: Session = Depends(get_read_db),
+    current_user: object = Depends(oauth2.get_current_user)  # create dependency
+):
+
+    # newline delimited json, one schemas.PostVote per line, sent as it is read
+    # the session (and its cursor) stays open until the last chunk is sent
+
+    partitions = db.execute(export_posts()).scalars().partitions()
+
+    return StreamingResponse(
+        serializers.ndjson_chunks(partitions, serializers.post_export_row),
+        media_type="application/x-ndjson"
+    )
 
 
 @ router.get("/{id}", response_model=schemas.PostVote)
 def get_post(
     id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: Session = Depends(get_read_db),
     current_user: object = Depends(oauth2.get_current_user)  # create dependency
 ):
 
+    key = cache.request_key(request)
+    cached = cache.post_responses.get(key)
+
+    if cached is not None:
+        return cache.cached_json_response(request, cached)
+
     # need .all() or .first() or .one() to commit
     post = db.query(
         models.Post,
-        func.count(models.Vote.post_id).label("votes")
+        models.Post.vote_count.label("votes")
     ) \
-        .join(models.Vote, models.Vote.post_id == models.Post.id, isouter=True) \
-        .group_by(models.Post.id) \
+        .options(joinedload(models.Post.user)) \
         .filter(models.Post.id == id) \
         .first()
 
@@ -75,7 +309,7 @@ def get_post(
     #         detail=f"Not authorised to perform requested action"
     #     )
 
-    return post
+    return cache.cached_json_response(request, cache_post(key, post))
 
 
 @ router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.PostOut)
@@ -94,35 +328,42 @@ def create_post(
     db.commit()
     db.refresh(new_post)
 
+    cache.invalidate_post(new_post.id, listed=True, searched=True)
+
     return new_post
 
 
-@ router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_post(
-    id: int,
+@ router.post("/bulk", response_model=schemas.IngestReport)
+def bulk_create_posts(
+    file: UploadFile = File(...),  # multipart upload, spooled to disk past 1MB
     db: Session = Depends(get_db),
     current_user: object = Depends(oauth2.get_current_user)  # create dependency
 ):
 
-    post_query = db.query(models.Post).filter(models.Post.id == id)
+    # many posts for the current user in one request, loaded with COPY (see ingest.py)
+    # 200 with a report even when some rows or batches were rejected
 
-    if post_query.first() is None:  # check if post exist
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"post with id: {id} does not exist"
-        )
+    return ingest.ingest(db, file.file, upload_format(file), current_user.id)
 
-    if post_query.first().user_id != current_user.id:  # check if user owns post
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not authorised to perform requested action"
-        )
+
+@ router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_post(
+    id: int,
+    db: Session = Depends(get_db),
+    current_user: object = Depends(oauth2.get_current_user)  # create dependency
+):
 
     # https://docs.sqlalchemy.org/en/14/orm/session_basics.html
-    post_query.delete(synchronize_session=False)
+    deleted = db.execute(delete_own_post(id, current_user.id)).first()
     db.commit()
 
-    return Response(status_code=status.HTTP_404_NOT_FOUND, content=f"post with id: {id} was deleted")
+    if deleted is None:  # missing, or someone else's
+        raise not_found_or_forbidden(id, db.query(models.Post.id).filter(models.Post.id == id).first())
+
+    cache.invalidate_post(id, listed=True, searched=True)
+    ranking.remove_post(id)
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
 @ router.put("/{id}", response_model=schemas.PostOut)
@@ -133,25 +374,12 @@ def update_post(
     current_user: object = Depends(oauth2.get_current_user)  # create dependency
 ):
 
-    post_query = db.query(models.Post).filter(models.Post.id == id)
-
-    if post_query.first() is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"post with id: {id} does not exist"
-        )
-
-    if post_query.first().user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"Not authorised to perform requested action"
-        )
+    updated = db.execute(update_own_post(id, current_user.id, post)).first()
+    db.commit()
 
-    post_query.update(
-        post.dict() | {"updated_at": text("current_timestamp")},
-        synchronize_session=False
-    )
+    if updated is None:  # missing, or someone else's
+        raise not_found_or_forbidden(id, db.query(models.Post.id).filter(models.Post.id == id).first())
 
-    db.commit()
+    cache.invalidate_post(id, searched=True)
 
-    return post_query.first()
+    return {**updated._mapping, "user": current_user}  # the owner is the current user
@@ -0,0 +1,214 @@
+from fastapi import Depends, File, Query, status, HTTPException, Request, Response, UploadFile, APIRouter
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from typing import Optional, List
+
+from ..database import get_async_db, get_read_async_db
+from .. import schemas, models, oauth2, cache, serializers, ingest, ranking
+from ..config import settings
+from .post import filter_posts, cache_posts, cache_post, export_posts, upload_format
+from .post import ranked_posts, ranked_posts_response
+from .post import update_own_post, delete_own_post, not_found_or_forbidden
+
+# async def versions of routers/post.py, mounted instead of it when settings.DATABASE_ASYNC is on
+# post.user is loaded with joinedload, lazy loading is not possible with an AsyncSession
+
+router = APIRouter(
+    prefix="/posts",  # for the path
+    tags=["Posts"]  # grouping in doc by category
+)
+
+
+# -- Query Helpers -------------------------------------------------------------
+
+async def get_post_with_user(db: AsyncSession, id: int):
+
+    # fresh copy of the post with its author, for PostOut responses
+    result = await db.execute(
+        select(models.Post)
+        .options(joinedload(models.Post.user))
+        .filter(models.Post.id == id)
+        .execution_options(populate_existing=True)
+    )
+
+    return result.scalars().one()
+
+
+# -- Post Requests -------------------------------------------------------------
+
+@ router.get("/", response_model=List[schemas.PostVote])
+async def get_all_posts(
+    request: Request,
+    db: AsyncSession = Depends(get_read_async_db),
+    current_user: object = Depends(oauth2.get_current_user_async),
+    limit: int = Query(10, ge=1, le=settings.POSTS_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    search: Optional[str] = "",
+    cursor: Optional[str] = None
+):
+
+    key = cache.request_key(request)
+    cached = cache.post_responses.get(key)
+
+    if cached is None:
+        posts_query = select(
+            models.Post,
+            models.Post.vote_count.label("votes")
+        ) \
+            .options(joinedload(models.Post.user))
+
+        posts = (await db.execute(filter_posts(posts_query, search, cursor, offset).limit(limit))).all()
+        cached = cache_posts(key, posts, limit, search)
+
+    return cache.cached_json_response(request, cached)
+
+
+@ router.get("/top", response_model=List[schemas.PostVote])  # before /{id}
+async def get_top_posts(
+    db: AsyncSession = Depends(get_read_async_db),
+    current_user: object = Depends(oauth2.get_current_user_async),
+    limit: int = Query(10, ge=1, le=settings.RANKING_SIZE)
+):
+
+    ids = ranking.top_posts.read(limit)
+
+    if ids is None:
+        ranking.top_posts.load((await db.execute(ranking.top_query())).all())
+        ids = ranking.top_posts.read(limit, check_stale=False)
+
+    return ranked_posts_response((await db.execute(ranked_posts(ids))).all() if ids else [], ids)
+
+
+@ router.get("/trending", response_model=List[schemas.PostVote])  # before /{id}
+async def get_trending_posts(
+    db: AsyncSession = Depends(get_read_async_db),
+    current_user: object = Depends(oauth2.get_current_user_async),
+    limit: int = Query(10, ge=1, le=settings.RANKING_SIZE)
+):
+
+    ids = ranking.trending_posts.read(limit)
+
+    if ids is None:
+        ranking.trending_posts.load((await db.execute(ranking.trending_query())).all())
+        ids = ranking.trending_posts.read(limit, check_stale=False)
+
+    return ranked_posts_response((await db.execute(ranked_posts(ids))).all() if ids else [], ids)
+
+
+@ router.get("/export", response_class=StreamingResponse)  # before /{id}
+async def export_all_posts(
+    db: AsyncSession = Depends(get_read_async_db),
+    current_user: object = Depends(oauth2.get_current_user_async)
+):
+
+    result = await db.stream(export_posts())
+
+    return StreamingResponse(
+        serializers.ndjson_chunks_async(result.scalars().partitions(), serializers.post_export_row),
+        media_type="application/x-ndjson"
+    )
+
+
+@ router.get("/{id}", response_model=schemas.PostVote)
+async def get_post(
+    id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_read_async_db),
+    current_user: object = Depends(oauth2.get_current_user_async)
+):
+
+    key = cache.request_key(request)
+    cached = cache.post_responses.get(key)
+
+    if cached is not None:
+        return cache.cached_json_response(request, cached)
+
+    post = (await db.execute(
+        select(
+            models.Post,
+            models.Post.vote_count.label("votes")
+        )
+        .options(joinedload(models.Post.user))
+        .filter(models.Post.id == id)
+    )).first()
+
+    if post is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"post with id: {id} does not exist"
+        )
+
+    return cache.cached_json_response(request, cache_post(key, post))
+
+
+@ router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.PostOut)
+async def create_post(
+    post: schemas.PostIn,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: object = Depends(oauth2.get_current_user_async)
+):
+
+    new_post = models.Post(
+        **post.dict(),
+        user_id=current_user.id
+    )
+
+    db.add(new_post)
+    await db.commit()
+
+    cache.invalidate_post(new_post.id, listed=True, searched=True)
+
+    return await get_post_with_user(db, new_post.id)
+
+
+@ router.post("/bulk", response_model=schemas.IngestReport)
+async def bulk_create_posts(
+    file: UploadFile = File(...),
+    current_user: object = Depends(oauth2.get_current_user_async)
+):
+
+    # COPY needs psycopg2, the load runs on the sync engine in the threadpool
+    return await run_in_threadpool(ingest.ingest_file, file.file, upload_format(file), current_user.id)
+
+
+@ router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_post(
+    id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: object = Depends(oauth2.get_current_user_async)
+):
+
+    deleted = (await db.execute(delete_own_post(id, current_user.id))).first()
+    await db.commit()
+
+    if deleted is None:
+        found_post = (await db.execute(select(models.Post.id).filter(models.Post.id == id))).first()
+        raise not_found_or_forbidden(id, found_post)
+
+    cache.invalidate_post(id, listed=True, searched=True)
+    ranking.remove_post(id)
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@ router.put("/{id}", response_model=schemas.PostOut)
+async def update_post(
+    id: int,
+    post: schemas.PostIn,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: object = Depends(oauth2.get_current_user_async)
+):
+
+    updated = (await db.execute(update_own_post(id, current_user.id, post))).first()
+    await db.commit()
+
+    if updated is None:
+        found_post = (await db.execute(select(models.Post.id).filter(models.Post.id == id))).first()
+        raise not_found_or_forbidden(id, found_post)
+
+    cache.invalidate_post(id, searched=True)
+
+    return {**updated._mapping, "user": current_user}
@@ -1,10 +1,14 @@
 from fastapi import Depends, status, HTTPException, Response, APIRouter
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from sqlalchemy.sql.expression import text
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, List
 
-from ..database import get_db
-from .. import schemas, models, utility, oauth2
+from ..database import get_db, get_read_db
+from .. import schemas, models, utility, oauth2, serializers
+from ..config import settings
 
 # router can create a prefix
 router = APIRouter(
@@ -13,39 +17,80 @@ router = APIRouter(
 )
 
 
+# -- Query Helpers -------------------------------------------------------------
+
+def export_users():
+
+    # every user, oldest first, read from a server side cursor in batches (see post.export_posts)
+    return select(models.User) \
+        .order_by(models.User.id) \
+        .execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+
+
+def email_taken(db: Session, email):
+
+    # closes the session after the lookup, no pooled connection held while bcrypt runs
+    try:
+        return db.query(models.User.id).filter(models.User.email == email).first() is not None
+    finally:
+        db.close()
+
+
+def insert_user(db: Session, user: schemas.UserIn):
+
+    new_user = models.User(**user.dict())
+
+    db.add(new_user)  # add and commit insert to db table
+    db.commit()
+    db.refresh(new_user)
+
+    return new_user
+
+
 # -- User Requests -------------------------------------------------------------
 
 @ router.get("/", response_model=List[schemas.UserOut])  # need to specify list of posts, using typing(List)
-def get_all_users(db: Session = Depends(get_db)):
+def get_all_users(db: Session = Depends(get_read_db)):
 
     users = db.query(models.User).all()
 
+    if settings.FAST_JSON:  # rows dumped straight to json (see serializers.py)
+        return Response(content=serializers.render_users(users), media_type="application/json")
+
     return users
 
 
 @ router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.UserOut)
-def create_user(user: schemas.UserIn, db: Session = Depends(get_db)):
+async def create_user(user: schemas.UserIn, db: Session = Depends(get_db)):
 
-    user_query = db.query(models.User).filter(models.User.email == user.email)
+    # async def: bcrypt is awaited in the password worker processes (see routers/auth.py),
+    # the database work runs in the threadpool before and after it
 
-    if user_query.first() is not None:  # check if user already created
+    if await run_in_threadpool(email_taken, db, user.email):  # check if user already created
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail=f"user with email: {user.email} already exist"
         )
 
-    user.password = utility.hash_pwd(user.password)  # overwrite password with hashed
-    new_user = models.User(**user.dict())
+    user.password = await utility.hash_pwd_async(user.password)  # overwrite password with hashed
 
-    db.add(new_user)  # add and commit insert to db table
-    db.commit()
-    db.refresh(new_user)
+    return await run_in_threadpool(insert_user, db, user)
 
-    return new_user
+
+@ router.get("/export", response_class=StreamingResponse)  # before /{id}, or "export" is parsed as an id
+def export_all_users(db: Session = Depends(get_read_db)):
+
+    # newline delimited json, one schemas.UserOut per line
+    partitions = db.execute(export_users()).scalars().partitions()
+
+    return StreamingResponse(
+        serializers.ndjson_chunks(partitions, serializers.user_row),
+        media_type="application/x-ndjson"
+    )
 
 
 @ router.get("/{id}", response_model=schemas.UserOut)
-def get_user(id: int, db: Session = Depends(get_db)):
+def get_user(id: int, db: Session = Depends(get_read_db)):
 
     # need .all() or .first() or .one() to commit
     user = db.query(models.User).filter(models.User.id == id).first()
@@ -0,0 +1,78 @@
+from fastapi import Depends, status, HTTPException, Response, APIRouter
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+
+from ..database import get_async_db, get_read_async_db
+from .. import schemas, models, utility, serializers
+from ..config import settings
+from .user import export_users
+
+# async def versions of routers/user.py, mounted instead of it when settings.DATABASE_ASYNC is on
+
+router = APIRouter(
+    prefix="/users",  # for the path
+    tags=["Users"]  # grouping in doc by category
+)
+
+
+# -- User Requests -------------------------------------------------------------
+
+@ router.get("/", response_model=List[schemas.UserOut])
+async def get_all_users(db: AsyncSession = Depends(get_read_async_db)):
+
+    users = (await db.execute(select(models.User))).scalars().all()
+
+    if settings.FAST_JSON:  # rows dumped straight to json (see serializers.py)
+        return Response(content=serializers.render_users(users), media_type="application/json")
+
+    return users
+
+
+@ router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.UserOut)
+async def create_user(user: schemas.UserIn, db: AsyncSession = Depends(get_async_db)):
+
+    found_user = (await db.execute(select(models.User).filter(models.User.email == user.email))).scalars().first()
+    await db.close()  # connection back to the pool while bcrypt runs, the insert takes a new one
+
+    if found_user is not None:  # check if user already created
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"user with email: {user.email} already exist"
+        )
+
+    # bcrypt runs in the password worker processes (see utility.py)
+    user.password = await utility.hash_pwd_async(user.password)
+    new_user = models.User(**user.dict())
+
+    db.add(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+
+    return new_user
+
+
+@ router.get("/export", response_class=StreamingResponse)  # before /{id}
+async def export_all_users(db: AsyncSession = Depends(get_read_async_db)):
+
+    result = await db.stream(export_users())
+
+    return StreamingResponse(
+        serializers.ndjson_chunks_async(result.scalars().partitions(), serializers.user_row),
+        media_type="application/x-ndjson"
+    )
+
+
+@ router.get("/{id}", response_model=schemas.UserOut)
+async def get_user(id: int, db: AsyncSession = Depends(get_read_async_db)):
+
+    user = (await db.execute(select(models.User).filter(models.User.id == id))).scalars().first()
+
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"post with id: {id} does not exist"
+        )
+
+    return user
@@ -1,10 +1,13 @@
 from fastapi import Depends, status, HTTPException, Response, APIRouter
+from sqlalchemy import case, delete, literal, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from sqlalchemy.sql.expression import text
 from typing import Optional, List
 
 from ..database import get_db
-from .. import schemas, models, oauth2
+from .. import schemas, models, oauth2, cache, ranking
 
 # router can create a prefix
 router = APIRouter(
@@ -13,66 +16,231 @@ router = APIRouter(
 )
 
 
-# -- Like/Unlike Requests ------------------------------------------------------
-# composite keys: primary keys that spans multiple columns - unique keys
+# -- Vote Helpers --------------------------------------------------------------
+# shared with routers/vote_async.py
+
+""" SINGLE STATEMENT VOTES
+
+- the vote insert/delete and the posts.vote_count update run as one statement
+(data modifying cte), postgres applies both or neither
+- like: INSERT ... ON CONFLICT DO NOTHING, a second like (even a concurrent one)
+inserts nothing instead of failing on the (post_id, user_id) primary key -> 409
+- like on a post that does not exist fails the votes.post_id foreign key -> 404
+- unlike: DELETE ... RETURNING, nothing deleted -> 404
+
+"""
+
+FOREIGN_KEY_VIOLATION = "23503"
+
+
+def add_vote(user_id, post_id):
+
+    # returns (post id, vote_count) when the vote was added, no row if it already existed
+
+    added_vote = pg_insert(models.Vote) \
+        .values(post_id=post_id, user_id=user_id) \
+        .on_conflict_do_nothing() \
+        .returning(models.Vote.post_id) \
+        .cte("added_vote")
+
+    return update(models.Post) \
+        .filter(models.Post.id.in_(select(added_vote.c.post_id))) \
+        .values(vote_count=models.Post.vote_count + 1) \
+        .returning(models.Post.id, models.Post.vote_count) \
+        .execution_options(synchronize_session=False)
+
+
+def remove_vote(user_id, post_id):
+
+    # returns (post id, vote_count) when the vote was deleted, no row if there was none
+
+    removed_vote = delete(models.Vote) \
+        .filter(models.Vote.post_id == post_id, models.Vote.user_id == user_id) \
+        .returning(models.Vote.post_id) \
+        .cte("removed_vote")
+
+    return update(models.Post) \
+        .filter(models.Post.id.in_(select(removed_vote.c.post_id))) \
+        .values(vote_count=models.Post.vote_count - 1) \
+        .returning(models.Post.id, models.Post.vote_count) \
+        .execution_options(synchronize_session=False)
 
-@ router.post("/", status_code=status.HTTP_201_CREATED)
-def vote(
-    vote: schemas.Vote,
-    db: Session = Depends(get_db),
-    current_user: object = Depends(oauth2.get_current_user)
-):
 
-    # check if post exist
+def is_foreign_key_violation(error: IntegrityError):
 
-    post = db.query(models.Post).filter(models.Post.id == vote.post_id).first()
+    # sqlstate of the driver error (psycopg2, and sqlalchemy's asyncpg adapter both set pgcode)
+    return getattr(error.orig, "pgcode", None) == FOREIGN_KEY_VIOLATION
 
-    if post is None:
+
+def post_not_found(post_id):
+
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"post with id: {post_id} does not exist"
+    )
+
+
+def vote_result(vote, changed, user_id):
+
+    # changed: row returned by add_vote/remove_vote, None when nothing changed
+
+    if changed is None and vote.dir == 1:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"user {user_id} has already voted on post {vote.post_id}"
+        )
+
+    if changed is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"post with id: {id} does not exist"
+            detail=f"vote does not exist"
         )
 
-    # check if vote exist for a post_id and user_id
+    cache.invalidate_post(vote.post_id)
+    ranking.record_vote(changed.id, changed.vote_count, vote.dir)
 
-    vote_query = db.query(models.Vote).filter(
-        models.Vote.post_id == vote.post_id,
-        models.Vote.user_id == current_user.id
-    )
+    return {"message": "successfully added vote" if vote.dir == 1 else "successfully deleted vote"}
 
-    found_vote = vote_query.first()
 
-    if vote.dir == 1:
-        if found_vote is None:
-            new_vote = models.Vote(post_id=vote.post_id, user_id=current_user.id)
-            db.add(new_vote)
-            db.commit()
+# -- Batch Helpers -------------------------------------------------------------
 
-            return {"message": "successfully added vote"}
+def latest_votes(items):
+
+    # {post_id: dir}, the last item wins when a post appears more than once
+    return {item.post_id: item.dir for item in items}
+
+
+def insert_votes(user_id, post_ids):
+
+    # one multi-row insert, selecting from posts skips ids that do not exist (no fk error)
+    # existing votes are left alone, RETURNING gives the post ids actually voted on
+
+    return pg_insert(models.Vote) \
+        .from_select(
+            ["user_id", "post_id"],
+            select(literal(user_id), models.Post.id).filter(models.Post.id.in_(post_ids))
+        ) \
+        .on_conflict_do_nothing() \
+        .returning(models.Vote.post_id)
+
+
+def delete_votes(user_id, post_ids):
+
+    # DELETE ... WHERE (post_id, user_id) IN (...) RETURNING post_id
+
+    return delete(models.Vote) \
+        .filter(tuple_(models.Vote.post_id, models.Vote.user_id).in_([(post_id, user_id) for post_id in post_ids])) \
+        .returning(models.Vote.post_id) \
+        .execution_options(synchronize_session=False)
 
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail=f"user {current_user.id} has already voted on post {vote.post_id}"
-            )
-
-    else:
-        if found_vote is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"vote does not exist"
-            )
+
+def update_vote_counts(added, removed):
+
+    # +1 / -1 on posts.vote_count for every changed post, in a single update
+    # returns (post id, vote_count) of each, for the rankings
+
+    return update(models.Post) \
+        .filter(models.Post.id.in_(sorted(added | removed))) \
+        .values(vote_count=models.Post.vote_count + case((models.Post.id.in_(sorted(added)), 1), else_=-1)) \
+        .returning(models.Post.id, models.Post.vote_count) \
+        .execution_options(synchronize_session=False)
+
+
+def record_vote_counts(vote_counts, added):
+
+    # after commit: cached responses of the changed posts, rankings
+
+    for post_id, vote_count in vote_counts:
+        cache.invalidate_post(post_id)
+        ranking.record_vote(post_id, vote_count, 1 if post_id in added else 0)
+
+
+def batch_results(items, added, removed, existing, user_id):
+
+    # per item, what POST /vote would have answered for it on its own
+
+    last_index = {item.post_id: index for index, item in enumerate(items)}
+    results = []
+
+    for index, item in enumerate(items):
+        if last_index[item.post_id] != index:
+            result = (status.HTTP_409_CONFLICT, f"post {item.post_id} appears again later in the batch")
+
+        elif item.dir == 1 and item.post_id in added:
+            result = (status.HTTP_201_CREATED, "successfully added vote")
+
+        elif item.dir == 1 and item.post_id in existing:
+            result = (status.HTTP_409_CONFLICT, f"user {user_id} has already voted on post {item.post_id}")
+
+        elif item.dir == 1:
+            result = (status.HTTP_404_NOT_FOUND, f"post with id: {item.post_id} does not exist")
+
+        elif item.post_id in removed:
+            result = (status.HTTP_201_CREATED, "successfully deleted vote")
 
         else:
-            vote_query.delete(synchronize_session=False)
-            db.commit()
+            result = (status.HTTP_404_NOT_FOUND, f"vote does not exist")
 
-            return {"message": "successfully deleted vote"}
+        results.append({"post_id": item.post_id, "dir": item.dir, "status": result[0], "detail": result[1]})
 
+    return results
+
+
+# -- Like/Unlike Requests ------------------------------------------------------
+# composite keys: primary keys that spans multiple columns - unique keys
 
 @ router.post("/", status_code=status.HTTP_201_CREATED)
-def all_votes(
+def vote(
+    vote: schemas.Vote,
     db: Session = Depends(get_db),
     current_user: object = Depends(oauth2.get_current_user)
 ):
-    pass
+
+    # one statement per direction, no separate post/vote existence checks (see vote helpers)
+
+    statement = add_vote(current_user.id, vote.post_id) if vote.dir == 1 else remove_vote(current_user.id, vote.post_id)
+
+    try:
+        changed = db.execute(statement).first()
+        db.commit()
+
+    except IntegrityError as e:
+        db.rollback()
+
+        if not is_foreign_key_violation(e):
+            raise
+
+        raise post_not_found(vote.post_id)
+
+    return vote_result(vote, changed, current_user.id)
+
+
+@ router.post("/batch", response_model=List[schemas.VoteResult])
+def batch_vote(
+    batch: schemas.VoteBatch,
+    db: Session = Depends(get_db),
+    current_user: object = Depends(oauth2.get_current_user)
+):
+
+    # many {post_id, dir} in one transaction, e.g. likes made offline
+    # a fixed number of statements whatever the batch size (see batch helpers above)
+
+    votes = latest_votes(batch.votes)
+    up_ids = [post_id for post_id, dir in votes.items() if dir == 1]
+    down_ids = [post_id for post_id, dir in votes.items() if dir == 0]
+
+    added = set(db.execute(insert_votes(current_user.id, up_ids)).scalars()) if up_ids else set()
+    removed = set(db.execute(delete_votes(current_user.id, down_ids)).scalars()) if down_ids else set()
+
+    vote_counts = db.execute(update_vote_counts(added, removed)).all() if added or removed else []
+
+    # posts a vote could not be added to: already voted, or the post does not exist
+    not_added = [post_id for post_id in up_ids if post_id not in added]
+    existing = set(db.execute(select(models.Post.id).filter(models.Post.id.in_(not_added))).scalars()) \
+        if not_added else set()
+
+    db.commit()
+
+    record_vote_counts(vote_counts, added)
+
+    return batch_results(batch.votes, added, removed, existing, current_user.id)
@@ -0,0 +1,70 @@
+from fastapi import Depends, status, APIRouter
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+
+from ..database import get_async_db
+from .. import schemas, models, oauth2
+from .vote import add_vote, remove_vote, is_foreign_key_violation, post_not_found, vote_result
+from .vote import latest_votes, insert_votes, delete_votes, update_vote_counts, record_vote_counts, batch_results
+
+# async def version of routers/vote.py, mounted instead of it when settings.DATABASE_ASYNC is on
+
+router = APIRouter(
+    prefix="/vote",  # for the path
+    tags=["Vote"]  # grouping in doc by category
+)
+
+
+# -- Like/Unlike Requests ------------------------------------------------------
+
+@ router.post("/", status_code=status.HTTP_201_CREATED)
+async def vote(
+    vote: schemas.Vote,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: object = Depends(oauth2.get_current_user_async)
+):
+
+    statement = add_vote(current_user.id, vote.post_id) if vote.dir == 1 else remove_vote(current_user.id, vote.post_id)
+
+    try:
+        changed = (await db.execute(statement)).first()
+        await db.commit()
+
+    except IntegrityError as e:
+        await db.rollback()
+
+        if not is_foreign_key_violation(e):
+            raise
+
+        raise post_not_found(vote.post_id)
+
+    return vote_result(vote, changed, current_user.id)
+
+
+@ router.post("/batch", response_model=List[schemas.VoteResult])
+async def batch_vote(
+    batch: schemas.VoteBatch,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: object = Depends(oauth2.get_current_user_async)
+):
+
+    votes = latest_votes(batch.votes)
+    up_ids = [post_id for post_id, dir in votes.items() if dir == 1]
+    down_ids = [post_id for post_id, dir in votes.items() if dir == 0]
+
+    added = set((await db.execute(insert_votes(current_user.id, up_ids))).scalars()) if up_ids else set()
+    removed = set((await db.execute(delete_votes(current_user.id, down_ids))).scalars()) if down_ids else set()
+
+    vote_counts = (await db.execute(update_vote_counts(added, removed))).all() if added or removed else []
+
+    not_added = [post_id for post_id in up_ids if post_id not in added]
+    existing = set((await db.execute(select(models.Post.id).filter(models.Post.id.in_(not_added)))).scalars()) \
+        if not_added else set()
+
+    await db.commit()
+
+    record_vote_counts(vote_counts, added)
+
+    return batch_results(batch.votes, added, removed, existing, current_user.id)
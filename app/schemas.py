@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr, conint
-from typing import Optional
+from pydantic import BaseModel, EmailStr, conint, conlist
+from typing import List, Optional
 from datetime import datetime
 
 """ PYDANTIC MODELS
@@ -82,8 +82,43 @@ class PostVote(BaseModel):
         orm_mode = True
 
 
+# -- Ingest Models -------------------------------------------------------------
+
+class IngestError(BaseModel):
+    line: int  # line of the uploaded file (first line of the batch when the whole batch failed)
+    detail: str
+
+
+class IngestBatch(BaseModel):  # response format, one per batch of POST /posts/bulk
+    batch: int
+    rows: int  # records read
+    inserted: int
+    rejected: int
+    errors: List[IngestError]  # the first few only, rejected has the full count
+    seconds: float
+
+
+class IngestReport(BaseModel):  # response format
+    inserted: int
+    rejected: int
+    seconds: float
+    rows_per_second: float
+    batches: List[IngestBatch]
+
+
 # -- Vote Models ---------------------------------------------------------------
 
 class Vote(BaseModel):
     post_id: int
     dir: conint(ge=0, le=1)
+
+
+class VoteBatch(BaseModel):
+    votes: conlist(Vote, min_items=1, max_items=1000)
+
+
+class VoteResult(BaseModel):  # response format, one per item of a VoteBatch
+    post_id: int
+    dir: int
+    status: int  # status code POST /vote would have answered for this item
+    detail: str
@@ -0,0 +1,131 @@
+import json
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+from typing import List
+
+from .config import settings
+from . import schemas
+
+""" JSON SERIALIZATION
+
+default: what fastapi does with a response_model, every row is validated into the
+pydantic schema (orm_mode), turned into python types by jsonable_encoder, then json.dumps
+
+FAST_JSON: rows straight from the orm are already trusted, the dicts are built by hand
+in the exact shape of the schemas and dumped with orjson (~10x faster for big pages)
+the routes keep their response_model, so the openapi schema does not change
+
+keep the *_row functions in step with schemas.py (same fields, same order)
+
+"""
+
+if settings.FAST_JSON:
+    import orjson
+
+
+# -- Row Builders --------------------------------------------------------------
+
+def user_row(user):
+
+    # schemas.UserOut
+    return {
+        "email": user.email,
+        "id": user.id,
+        "created_at": user.created_at,
+    }
+
+
+def post_row(post):
+
+    # schemas.PostOut
+    return {
+        "title": post.title,
+        "content": post.content,
+        "published": post.published,
+        "id": post.id,
+        "user_id": post.user_id,
+        "user": user_row(post.user),
+        "created_at": post.created_at,
+        "updated_at": post.updated_at,
+    }
+
+
+def post_vote_row(row):
+
+    # schemas.PostVote, row of (Post, votes)
+    return {
+        "Post": post_row(row.Post),
+        "votes": row.votes,
+    }
+
+
+# -- Renderers -----------------------------------------------------------------
+
+def render_json(model, content):
+
+    # the default path: validate, jsonable_encoder, json.dumps (as fastapi's JSONResponse)
+    return json.dumps(
+        jsonable_encoder(parse_obj_as(model, content)),
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+
+def render_posts(posts):
+
+    if settings.FAST_JSON:
+        return orjson.dumps([post_vote_row(row) for row in posts])
+
+    return render_json(List[schemas.PostVote], posts)
+
+
+def render_post(post):
+
+    if settings.FAST_JSON:
+        return orjson.dumps(post_vote_row(post))
+
+    return render_json(schemas.PostVote, post)
+
+
+def render_users(users):
+
+    if settings.FAST_JSON:
+        return orjson.dumps([user_row(user) for user in users])
+
+    return render_json(List[schemas.UserOut], users)
+
+
+# -- NDJSON Streams ------------------------------------------------------------
+# one json document per line, written one batch of rows at a time (see the /export routes)
+
+def render_ndjson(rows):
+
+    if settings.FAST_JSON:
+        return b"".join(orjson.dumps(row) + b"\n" for row in rows)
+
+    return "".join(
+        json.dumps(jsonable_encoder(row), ensure_ascii=False, separators=(",", ":")) + "\n" for row in rows
+    ).encode("utf-8")
+
+
+def ndjson_chunks(partitions, to_row):
+
+    # partitions: batches of orm objects from a server side cursor
+    for partition in partitions:
+        yield render_ndjson(to_row(item) for item in partition)
+
+
+async def ndjson_chunks_async(partitions, to_row):
+
+    async for partition in partitions:
+        yield render_ndjson(to_row(item) for item in partition)
+
+
+def post_export_row(post):
+
+    # schemas.PostVote, from a Post with its user loaded
+    return {
+        "Post": post_row(post),
+        "votes": post.vote_count,
+    }
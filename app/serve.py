@@ -0,0 +1,128 @@
+import argparse
+import math
+import os
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+from .config import settings
+
+""" PRODUCTION SERVER
+
+python -m app.serve: gunicorn managing uvicorn workers, one process per cpu core
+(a single uvicorn process runs python on one core, whatever the machine has)
+
+- workers: SERVER_WORKERS, or the cpus this process may use: the container's cgroup cpu
+quota (docker --cpus, kubernetes limits) and the cpu affinity, not the host's core count
+- every worker runs uvloop (event loop) and httptools (http parser) instead of the pure
+python fallbacks uvicorn picks when they are missing
+- keep-alive: idle connections stay open SERVER_KEEPALIVE seconds, keep it above the load
+balancer's idle timeout or it may reuse a connection the worker just closed (502)
+- backlog: connections the kernel queues before accept()
+- recycling: a worker is replaced after SERVER_MAX_REQUESTS (+ random jitter) requests, it stops
+accepting, finishes what it has (SERVER_GRACEFUL_TIMEOUT) while the new one starts,
+bounds slow memory growth (caches, fragmentation)
+- preload: the app is imported once in the master and forked, engines and pools are only
+made in each worker's startup handler (see main.py)
+- each worker has its own connection pool: keep workers * (DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW)
+under postgres' max_connections
+
+    python -m app.serve
+    python -m app.serve --port 5000 --workers 4
+
+"""
+
+class Worker(UvicornWorker):
+
+    # gunicorn --worker-class app.serve.Worker
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+
+def cgroup_cpu_limit():
+
+    # cpus allowed by the cgroup quota (e.g. 1.5), None without a limit
+
+    try:  # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as file:
+            quota, period = file.read().split()
+
+        return int(quota) / int(period) if quota != "max" else None
+
+    except (OSError, ValueError):
+        pass
+
+    try:  # cgroup v1, quota -1 without a limit
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as file:
+            quota = int(file.read())
+
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as file:
+            period = int(file.read())
+
+        return quota / period if quota > 0 else None
+
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus():
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    limit = cgroup_cpu_limit()
+
+    if limit:
+        cpus = min(cpus, math.ceil(limit))
+
+    return max(1, cpus)
+
+
+def server_options(host, port, workers):
+
+    # gunicorn settings (gunicorn --help), workers=0 means available_cpus()
+
+    return {
+        "bind": f"{host}:{port}",
+        "workers": workers or available_cpus(),
+        "worker_class": "app.serve.Worker",
+        "keepalive": settings.SERVER_KEEPALIVE,
+        "backlog": settings.SERVER_BACKLOG,
+        "max_requests": settings.SERVER_MAX_REQUESTS,
+        "max_requests_jitter": settings.SERVER_MAX_REQUESTS_JITTER,
+        "graceful_timeout": settings.SERVER_GRACEFUL_TIMEOUT,
+        "preload_app": settings.SERVER_PRELOAD,
+        "accesslog": "-",
+    }
+
+
+class Server(BaseApplication):
+
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from .main import app
+
+        return app
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="serve the api with gunicorn and uvicorn workers")
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS, help="0: one per available cpu")
+    args = parser.parse_args(argv)
+
+    options = server_options(args.host, args.port, args.workers)
+
+    connections = options["workers"] * (settings.DATABASE_POOL_SIZE + settings.DATABASE_MAX_OVERFLOW)
+    print(f"serving on {options['bind']} with {options['workers']} workers, up to {connections} database connections")
+
+    Server(options).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import math
+import time
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security.oauth2 import OAuth2PasswordRequestForm
+
+from .cache import LRUCache
+from .config import settings
+
+""" LOGIN THROTTLING
+
+every POST /login costs a bcrypt verification (~0.25s of cpu at 12 rounds), a burst of
+guesses or a client retrying in a loop can keep every core busy
+
+- token bucket per client address and per username: burst attempts at once, then
+rate attempts per second
+- checked by a route dependency, before the user lookup and before bcrypt,
+a rejected attempt gets 429 with Retry-After (seconds until the next attempt is allowed)
+- failed and successful attempts count the same
+
+backends (settings.LOGIN_THROTTLE_BACKEND):
+
+    memory    buckets in this worker, each worker allows the full rate
+    redis     buckets shared by every worker (pip install redis, settings.REDIS_URL),
+              updated by one lua script so concurrent attempts cannot both take the last token
+    off       no limit
+
+the client address is what uvicorn reports, run it with --proxy-headers behind a proxy
+
+"""
+
+if settings.LOGIN_THROTTLE_BACKEND == "redis":
+    import redis
+
+
+class MemoryBackend:
+
+    def __init__(self):
+        self.buckets = {}  # (rate, burst) -> LRUCache of key -> (tokens, updated)
+
+    def bucket_cache(self, rate, burst):
+
+        # a bucket that refilled completely is the same as no bucket: expire it then
+        cache = self.buckets.get((rate, burst))
+
+        if cache is None:
+            cache = self.buckets.setdefault((rate, burst), LRUCache(100000, burst / rate))
+
+        return cache
+
+    def take(self, key, rate, burst):
+
+        # returns 0 when allowed, otherwise seconds until a token is back
+
+        cache = self.bucket_cache(rate, burst)
+        now = time.monotonic()
+
+        with cache.lock:
+            tokens, updated = cache.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+
+            if tokens < 1:
+                return (1 - tokens) / rate
+
+            cache.set(key, (tokens - 1, now))
+
+        return 0
+
+
+class RedisBackend:
+
+    # KEYS[1]: bucket, ARGV: rate, burst. redis' own clock, workers' clocks may differ
+    SCRIPT = """
+        local rate = tonumber(ARGV[1])
+        local burst = tonumber(ARGV[2])
+        local clock = redis.call("TIME")
+        local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+        local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+        local tokens = tonumber(bucket[1]) or burst
+        local updated = tonumber(bucket[2]) or now
+        tokens = math.min(burst, tokens + (now - updated) * rate)
+
+        if tokens < 1 then
+            return tostring((1 - tokens) / rate)
+        end
+
+        redis.call("HSET", KEYS[1], "tokens", tokens - 1, "updated", now)
+        redis.call("PEXPIRE", KEYS[1], math.ceil(burst / rate * 1000))
+        return "0"
+    """
+
+    def __init__(self):
+        self.client = redis.Redis.from_url(settings.REDIS_URL)
+        self.script = self.client.register_script(self.SCRIPT)
+
+    def take(self, key, rate, burst):
+        return float(self.script(keys=[f"login_throttle:{key}"], args=[rate, burst]))
+
+
+BACKENDS = {
+    "memory": MemoryBackend,
+    "redis": RedisBackend,
+}
+
+backend = BACKENDS[settings.LOGIN_THROTTLE_BACKEND]() if settings.LOGIN_THROTTLE_BACKEND != "off" else None
+
+
+def login_retry_after(address, username):
+
+    # the address bucket first, a client over its limit does not drain the username's
+
+    retry_after = backend.take(f"ip:{address}", settings.LOGIN_IP_RATE, settings.LOGIN_IP_BURST)
+
+    if not retry_after:
+        retry_after = backend.take(
+            f"user:{username.strip().lower()}", settings.LOGIN_USERNAME_RATE, settings.LOGIN_USERNAME_BURST
+        )
+
+    return retry_after
+
+
+def limit_login(request: Request, user_credentials: OAuth2PasswordRequestForm = Depends()):
+
+    # route dependency, the form is parsed once and shared with the route (dependency cache)
+
+    if backend is None:
+        return
+
+    address = request.client.host if request.client else ""
+    retry_after = login_retry_after(address, user_credentials.username)
+
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Too many login attempts, try again later",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
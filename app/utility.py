@@ -1,17 +1,200 @@
-from passlib.context import CryptContext
+import asyncio
+import base64
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
 
 # additional functions used to authenticate users and privatise passwords
 
-pwd_context = CryptContext(schemes=["bcrypt"])
+""" PASSWORD HASHING
+
+- bcrypt is slow on purpose (~250ms of cpu at cost 12), run inline it holds the gil
+and a threadpool slot, so a burst of logins stalls every other request of the worker
+- hashing/verifying runs in a small pool of worker processes instead,
+PASSWORD_HASH_WORKERS=0 runs it inline (tests, scripts)
+- the routes (login, create user) are async def and await the pool, a sync caller would
+still hold a threadpool thread for the whole wait: the blocking versions are for scripts
+- BCRYPT_ROUNDS is the cost factor, hashes made with another cost are rehashed
+on the next successful login (passlib needs_update)
+- passlib is imported on first use, not by every process importing the app
+- a worker process that dies (oom kill, segfault) breaks the whole pool: every later
+submit raises BrokenProcessPool, so the broken pool is shut down, a new one started and
+the call retried once (instead of every login failing until the server worker restarts)
+
+"""
+
+pwd_context = None
+
+pwd_pool = None
+
+
+def get_pwd_context():
+
+    global pwd_context
+
+    if pwd_context is None:
+        from passlib.context import CryptContext
+
+        pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+    return pwd_context
+
+
+def _hash_pwd(password: str):
+
+    # runs in the worker process
+    return get_pwd_context().hash(password)
+
+
+def _verify_and_update_pwd(plain_pwd, hash_pwd):
+
+    # runs in the worker process, returns (valid, new hash if the old one is outdated)
+
+    pwd_context = get_pwd_context()
+
+    if not pwd_context.verify(plain_pwd, hash_pwd):
+        return False, None
+
+    if pwd_context.needs_update(hash_pwd):
+        return True, pwd_context.hash(plain_pwd)
+
+    return True, None
+
+
+def get_pwd_pool():
+
+    # started on first use, spawn so workers do not inherit the server's threads and sockets
+
+    global pwd_pool
+
+    if pwd_pool is None and settings.PASSWORD_HASH_WORKERS > 0:
+        pwd_pool = ProcessPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+    return pwd_pool
+
+
+def shutdown_pwd_pool():
+
+    global pwd_pool
+
+    if pwd_pool is not None:
+        pwd_pool.shutdown()
+        pwd_pool = None
+
+
+def reset_pwd_pool(broken_pool):
+
+    # a worker died, the next get_pwd_pool() starts a new pool (unless another call already did)
+
+    global pwd_pool
+
+    if pwd_pool is broken_pool:
+        pwd_pool = None
+
+    broken_pool.shutdown(wait=False)
+
+
+def run_in_pwd_pool(fn, *args):
+
+    # blocks the calling thread (not the gil) until the worker is done, scripts only
+
+    for attempt in range(2):
+        pool = get_pwd_pool()
+
+        if pool is None:
+            return fn(*args)
+
+        try:
+            return pool.submit(fn, *args).result()
+
+        except BrokenProcessPool:
+            reset_pwd_pool(pool)
+
+            if attempt:
+                raise
+
+
+async def run_in_pwd_pool_async(fn, *args):
+
+    for attempt in range(2):
+        pool = get_pwd_pool()
+
+        if pool is None:
+            return await run_in_threadpool(fn, *args)  # inline, but not on the event loop
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+        except BrokenProcessPool:
+            reset_pwd_pool(pool)
+
+            if attempt:
+                raise
 
 
 def hash_pwd(password: str):
 
     # hash passwords for security - user.password
-    return pwd_context.hash(password)
+    return run_in_pwd_pool(_hash_pwd, password)
 
 
 def verify_pwd(plain_pwd, hash_pwd):
 
     # check between user input password and stored hashed password
-    return pwd_context.verify(plain_pwd, hash_pwd)
+    return run_in_pwd_pool(_verify_and_update_pwd, plain_pwd, hash_pwd)[0]
+
+
+def verify_and_update_pwd(plain_pwd, hash_pwd):
+
+    # check password, and get a new hash when the stored one uses an outdated cost
+    return run_in_pwd_pool(_verify_and_update_pwd, plain_pwd, hash_pwd)
+
+
+async def hash_pwd_async(password: str):
+
+    return await run_in_pwd_pool_async(_hash_pwd, password)
+
+
+async def verify_and_update_pwd_async(plain_pwd, hash_pwd):
+
+    return await run_in_pwd_pool_async(_verify_and_update_pwd, plain_pwd, hash_pwd)
+
+
+# -- Pagination Cursors --------------------------------------------------------
+
+""" KEYSET (CURSOR) PAGINATION
+
+- limit/offset makes postgres build and throw away every skipped row
+- a cursor remembers the sort key of the last row sent: (created_at, id)
+- next page: WHERE (created_at, id) < (cursor) ORDER BY created_at DESC, id DESC
+- cost of page n is the same as page 1 (index seek on posts(created_at, id))
+- cursor is opaque to clients (urlsafe base64), only pass it back as-is
+
+"""
+
+
+def encode_cursor(created_at: datetime, id: int):
+
+    raw = f"{created_at.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+
+    # raises ValueError for anything not produced by encode_cursor
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+
+        return datetime.fromisoformat(created_at), int(id)
+
+    except ValueError:  # also covers bad base64 / utf-8
+        raise ValueError(f"invalid cursor: {cursor}")
@@ -0,0 +1,210 @@
+import argparse
+import asyncio
+import json
+import os
+
+from .imports import IMPORT_BUDGET_MS  # stdlib only, does not import the app
+
+""" BENCHMARKS
+
+seeds a database, drives the api's routes and reports throughput, p50/p95/p99 latency
+and database queries per request, results are saved as json to compare against a baseline
+
+uses the app's settings (.env): point DATABASE_* at a scratch database, seed truncates it
+
+install: pip install -r requirements-dev.txt (httpx, not needed by the app itself)
+
+commands:
+
+    python -m bench seed --users 1000 --posts 10000 --votes 50000
+    python -m bench run --save baseline.json
+    python -m bench run --baseline baseline.json          exits 1 on a regression
+    python -m bench run --uvicorn --concurrency 50        through a real uvicorn server
+    python -m bench run --scenarios posts,post --no-cache
+    python -m bench compare baseline.json results.json
+    python -m bench plans --max-rows 1000                 exits 1 when a query scans a big table
+    python -m bench imports --budget-ms 900               exits 1 when importing the app got slow
+    python -m bench compression                           cpu vs bytes of gzip / brotli levels
+    python -m bench run --no-compression                  responses sent uncompressed
+
+scenarios: login, posts (GET /posts), post (GET /posts/{id}), vote, users (GET /users)
+
+"""
+
+
+def seed_command(args):
+
+    from app.database import SessionLocal, create_engines
+    from .seed import seed
+
+    create_engines()
+    db = SessionLocal()
+
+    try:
+        seed(db, args.users, args.posts, args.votes, seed=args.seed)
+    finally:
+        db.close()
+
+    print(f"seeded {args.users} users, {args.posts} posts, {args.votes} votes")
+
+    return 0
+
+
+def run_command(args):
+
+    # read by app.config when the app is imported below
+
+    if args.no_cache:
+        os.environ["AUTH_CACHE_SIZE"] = "0"
+        os.environ["RESPONSE_CACHE_SIZE"] = "0"
+
+    if args.no_compression:
+        os.environ["COMPRESSION_ENABLED"] = "0"
+
+    # every request comes from one address, the login throttle would answer most with 429
+    os.environ.setdefault("LOGIN_THROTTLE_BACKEND", "off")
+
+    from .runner import SCENARIOS, run
+
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+
+    if unknown:
+        raise SystemExit(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    results = asyncio.run(run(
+        names, args.requests, args.concurrency, args.warmup, args.port if args.uvicorn else None, args.seed
+    ))
+
+    for name, result in results["scenarios"].items():
+        print(
+            f"{name:<10} {result['rps']:>9} req/s  p50 {result['p50_ms']:>9} ms  p95 {result['p95_ms']:>9} ms  "
+            f"p99 {result['p99_ms']:>9} ms  {result['queries_per_request']:>5} queries/req  "
+            f"{result['kb_per_request']:>8} kB/req  {result['statuses']}"
+        )
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        return compare_results(load(args.baseline), results, args.threshold)
+
+    return 0
+
+
+def plans_command(args):
+
+    from app.database import SessionLocal, create_engines
+    from .plans import check_plans
+
+    create_engines()
+    db = SessionLocal()
+
+    try:
+        lines, failures = check_plans(db, args.max_rows)
+    finally:
+        db.close()
+
+    print("\n".join(lines))
+    print(f"{failures} query plan(s) with a sequential scan")
+
+    return 1 if failures else 0
+
+
+def imports_command(args):
+
+    from .imports import check_imports
+
+    lines, failures = check_imports(args.runs, args.budget_ms, args.top)
+    print("\n".join(lines))
+
+    return 1 if failures else 0
+
+
+def compression_command(args):
+
+    from .compression import compare_encodings
+
+    print("\n".join(compare_encodings(args.repeat, args.seed)))
+
+    return 0
+
+
+def compare_command(args):
+
+    return compare_results(load(args.baseline), load(args.current), args.threshold)
+
+
+def load(path):
+
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare_results(baseline, current, threshold):
+
+    from .compare import compare
+
+    lines, regressions = compare(baseline, current, threshold)
+    print("\n".join(lines))
+    print(f"{regressions} regression(s)")
+
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(prog="python -m bench", description="benchmark the api")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="truncate and fill users, posts and votes")
+    seed_parser.add_argument("--users", type=int, default=1000)
+    seed_parser.add_argument("--posts", type=int, default=10000)
+    seed_parser.add_argument("--votes", type=int, default=50000)
+    seed_parser.add_argument("--seed", type=int, default=0, help="random seed")
+    seed_parser.set_defaults(handler=seed_command)
+
+    run_parser = commands.add_parser("run", help="run the scenarios")
+    run_parser.add_argument("--scenarios", help="comma separated, default: all")
+    run_parser.add_argument("--requests", type=int, default=500, help="per scenario")
+    run_parser.add_argument("--concurrency", type=int, default=10)
+    run_parser.add_argument("--warmup", type=int, default=50, help="requests per scenario before measuring")
+    run_parser.add_argument("--uvicorn", action="store_true", help="through a uvicorn server instead of in-process")
+    run_parser.add_argument("--port", type=int, default=8765)
+    run_parser.add_argument("--no-cache", action="store_true", help="turn the user and response caches off")
+    run_parser.add_argument("--no-compression", action="store_true", help="send responses uncompressed")
+    run_parser.add_argument("--seed", type=int, default=0, help="random seed")
+    run_parser.add_argument("--save", help="write the results to this json file")
+    run_parser.add_argument("--baseline", help="compare against this results file")
+    run_parser.add_argument("--threshold", type=float, default=0.10)
+    run_parser.set_defaults(handler=run_command)
+
+    compare_parser = commands.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+    compare_parser.set_defaults(handler=compare_command)
+
+    plans_parser = commands.add_parser("plans", help="EXPLAIN the app's queries, fail on sequential scans")
+    plans_parser.add_argument("--max-rows", type=int, default=1000, help="tables up to this size may be scanned")
+    plans_parser.set_defaults(handler=plans_command)
+
+    imports_parser = commands.add_parser("imports", help="time importing the app, fail over the budget")
+    imports_parser.add_argument("--runs", type=int, default=5)
+    imports_parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    imports_parser.add_argument("--top", type=int, default=10, help="slowest modules to list")
+    imports_parser.set_defaults(handler=imports_command)
+
+    compression_parser = commands.add_parser("compression", help="compression ratio and cpu time per level")
+    compression_parser.add_argument("--repeat", type=int, default=10, help="timed runs per payload and level")
+    compression_parser.add_argument("--seed", type=int, default=0, help="random seed")
+    compression_parser.set_defaults(handler=compression_command)
+
+    args = parser.parse_args(argv)
+
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
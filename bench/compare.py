@@ -0,0 +1,64 @@
+""" BASELINE COMPARISON
+
+- every scenario in both results is compared metric by metric
+- latency and throughput are noisy: a change only counts as a regression past threshold
+(0.10 = 10% slower / less throughput)
+- queries per request are exact: any increase is a regression (an n+1 creeping back in)
+- metrics missing from one of the results (files saved by older versions) are skipped
+
+"""
+
+# metric -> True when higher is better
+METRICS = {
+    "rps": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "queries_per_request": False,
+    "kb_per_request": False,
+}
+
+
+def change(before, after):
+
+    return (after - before) / before if before else 0.0
+
+
+def is_regression(metric, before, after, threshold):
+
+    if metric == "queries_per_request":
+        return after > before
+
+    if METRICS[metric]:
+        return change(before, after) < -threshold
+
+    return change(before, after) > threshold
+
+
+def compare(baseline, current, threshold=0.10):
+
+    # returns (report lines, number of regressions)
+
+    lines = [f"{'scenario':<10} {'metric':<20} {'baseline':>12} {'current':>12} {'change':>9}"]
+    regressions = 0
+
+    for name, after in current["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+
+        if before is None:
+            lines.append(f"{name:<10} (not in baseline)")
+            continue
+
+        for metric in METRICS:
+            if metric not in before or metric not in after:
+                continue
+
+            regressed = is_regression(metric, before[metric], after[metric], threshold)
+            regressions += regressed
+
+            lines.append(
+                f"{name:<10} {metric:<20} {before[metric]:>12} {after[metric]:>12} "
+                f"{change(before[metric], after[metric]):>+9.1%}{'  REGRESSION' if regressed else ''}"
+            )
+
+    return lines, regressions
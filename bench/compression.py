@@ -0,0 +1,132 @@
+import random
+import statistics
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from app import compression, models, serializers
+from . import seed
+
+""" COMPRESSION TRADE-OFF
+
+cpu time against bytes saved for each encoding and level, on the api's own payloads
+(rendered by serializers.py from made up rows, no database needed)
+
+    payload     GET /posts?limit=10|100|1000, GET /users (1000), GET /posts/export (1000 rows, ndjson)
+    size        compressed bytes and the ratio to the uncompressed body
+    ms          median time to compress the body once, on this machine
+    MB/s        uncompressed megabytes compressed per second of cpu
+
+end to end (compressed vs not, same scenarios): python -m bench run --no-compression
+against python -m bench run, kb_per_request is what went over the wire
+
+    python -m bench compression --repeat 20
+
+"""
+
+Row = namedtuple("Row", ["Post", "votes"])
+
+GZIP_LEVELS = (1, 5, 6, 9)
+BROTLI_QUALITIES = (1, 4, 5, 11)
+
+
+def make_users(count, rng):
+
+    now = datetime.now(timezone.utc)
+
+    return [
+        models.User(id=i + 1, email=seed.email(i), created_at=now - timedelta(days=rng.randint(0, 365)))
+        for i in range(count)
+    ]
+
+
+def make_rows(count, users, rng):
+
+    now = datetime.now(timezone.utc)
+    rows = []
+
+    for i in range(count):
+        user = rng.choice(users)
+        created_at = now - timedelta(minutes=rng.randint(0, 100000))
+        votes = rng.randint(0, 50)
+
+        post = models.Post(
+            id=i + 1, title=" ".join(rng.choices(seed.WORDS, k=4)), content=" ".join(rng.choices(seed.WORDS, k=40)),
+            published=True, user_id=user.id, user=user, vote_count=votes, created_at=created_at, updated_at=created_at
+        )
+        rows.append(Row(post, votes))
+
+    return rows
+
+
+def payloads(rng):
+
+    # name -> uncompressed body, as the routes send it
+
+    users = make_users(1000, rng)
+    rows = make_rows(1000, users, rng)
+
+    return {
+        "posts?limit=10": serializers.render_posts(rows[:10]),
+        "posts?limit=100": serializers.render_posts(rows[:100]),
+        "posts?limit=1000": serializers.render_posts(rows),
+        "users (1000)": serializers.render_users(users),
+        "posts/export": serializers.render_ndjson([serializers.post_export_row(row.Post) for row in rows]),
+    }
+
+
+def encoders():
+
+    # (label, encoding, settings field, level)
+
+    found = [(f"gzip {level}", "gzip", "COMPRESSION_GZIP_LEVEL", level) for level in GZIP_LEVELS]
+
+    if compression.brotli is not None:
+        found += [(f"br {quality}", "br", "COMPRESSION_BROTLI_QUALITY", quality) for quality in BROTLI_QUALITIES]
+
+    return found
+
+
+def time_compression(body, encoding, repeat):
+
+    # (compressed size, median seconds)
+
+    timings = []
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        compressed = compression.compress(body, encoding)
+        timings.append(time.perf_counter() - started)
+
+    return len(compressed), statistics.median(timings)
+
+
+def compare_encodings(repeat=10, random_seed=0):
+
+    # report lines, levels are set on the app's settings for the duration
+
+    settings = compression.settings
+    configured = (settings.COMPRESSION_GZIP_LEVEL, settings.COMPRESSION_BROTLI_QUALITY)
+    lines = [f"{'payload':<18} {'encoding':<9} {'bytes':>10} {'ratio':>7} {'ms':>9} {'MB/s':>8}"]
+
+    try:
+        for name, body in payloads(random.Random(random_seed)).items():
+            lines.append(f"{name:<18} {'none':<9} {len(body):>10}")
+
+            for label, encoding, field, level in encoders():
+                setattr(settings, field, level)
+                size, seconds = time_compression(body, encoding, repeat)
+
+                lines.append(
+                    f"{'':<18} {label:<9} {size:>10} {len(body) / size:>6.1f}x {1000 * seconds:>9.3f} "
+                    f"{len(body) / seconds / 1e6 if seconds else 0:>8.1f}"
+                    f"{'  (configured)' if level == configured[encoding == 'br'] else ''}"
+                )
+
+    finally:
+        settings.COMPRESSION_GZIP_LEVEL, settings.COMPRESSION_BROTLI_QUALITY = configured
+
+    if compression.brotli is None:
+        lines.append("brotli is not installed (pip install brotli), gzip only")
+
+    return lines
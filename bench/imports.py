@@ -0,0 +1,95 @@
+import json
+import os
+import subprocess
+import sys
+
+""" IMPORT TIME
+
+how long a new worker takes to import the app (python -c "import app.main") before it
+can run its startup handlers, measured in fresh interpreters, the fastest of several runs
+(a busy machine only ever adds time, the fastest run is the most repeatable)
+
+- fails over the budget, or when importing the app already did what create_app defers
+to the startup handler or to first use (see main.py): an engine, jose, passlib
+- python -X importtime lists the slowest modules, to see what a regression pulled in
+- the same check runs with the tests (tests/test_imports.py), IMPORT_BUDGET_MS=... for a slower machine
+
+    python -m bench imports --budget-ms 900
+
+"""
+
+DEFERRED_MODULES = ("jose", "passlib", "psycopg2")
+
+IMPORT_BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", 900))  # ~800 ms measured, a regression goes over
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# prints seconds, the deferred modules that were imported anyway and whether an engine exists
+PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import app.main
+seconds = time.perf_counter() - started
+from app import database
+print(json.dumps({{
+    "seconds": seconds,
+    "imported": [name for name in {DEFERRED_MODULES!r} if name in sys.modules],
+    "engine": database.engine is not None,
+}}))
+"""
+
+
+def probe():
+
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], capture_output=True, text=True, check=True, cwd=ROOT
+    ).stdout
+
+    return json.loads(output.splitlines()[-1])
+
+
+def slowest_modules(count):
+
+    # (cumulative microseconds, module) from -X importtime (written to stderr)
+
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"], capture_output=True, text=True, check=True,
+        cwd=ROOT
+    ).stderr
+
+    modules = []
+
+    for line in stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = line.split("|")
+            modules.append((int(cumulative), name.strip()))
+
+    return sorted(modules, reverse=True)[:count]
+
+
+def check_imports(runs, budget_ms, top):
+
+    # returns (lines, failures)
+
+    results = [probe() for _ in range(runs)]
+    fastest_ms = 1000 * min(result["seconds"] for result in results)
+    failures = 0
+
+    lines = [f"import app.main: fastest {fastest_ms:.1f} ms of {runs} run(s), budget {budget_ms} ms"]
+
+    if fastest_ms > budget_ms:
+        failures += 1
+        lines.append("FAIL  over budget")
+
+    if results[0]["imported"]:
+        failures += 1
+        lines.append(f"FAIL  imported when the app is: {', '.join(results[0]['imported'])}")
+
+    if results[0]["engine"]:
+        failures += 1
+        lines.append("FAIL  an engine was created when the app is imported")
+
+    lines.append("slowest imports (cumulative):")
+    lines.extend(f"  {microseconds / 1000:>8.1f} ms  {name}" for microseconds, name in slowest_modules(top))
+
+    return lines, failures
@@ -0,0 +1,129 @@
+from datetime import datetime, timezone
+from sqlalchemy import select, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import joinedload
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app import models, ranking, schemas, utility
+from app.routers import post, vote
+
+""" QUERY PLANS
+
+EXPLAIN (FORMAT JSON) of the app's queries against the seeded database, a query fails
+when its plan reads a whole table bigger than max_rows (Seq Scan): a missing or unusable index
+
+- the statements come from the same helpers the routes use (routers/post.py, routers/vote.py,
+ranking.py), the lookups of oauth2.py and routers/auth.py are rebuilt the same way
+- plain EXPLAIN plans without running, the inserts, updates and deletes change nothing
+- table sizes are the planner's (pg_class.reltuples), seed runs ANALYZE
+- ids 1 and 2 exist after python -m bench seed
+
+    python -m bench plans --max-rows 1000
+
+- tests/test_plans.py runs the same check with the tests when TEST_DATABASE_URL is set
+
+"""
+
+
+class Explain(Executable, ClauseElement):
+
+    # EXPLAIN (FORMAT JSON) <statement>, bound parameters are passed as usual
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+        # read off the outermost statement by the compiler when it is an insert, update or delete
+        self._returning = getattr(statement, "_returning", ())
+        self._inline = getattr(statement, "_inline", False)
+        self._return_defaults = getattr(statement, "_return_defaults", False)
+
+
+@compiles(Explain, "postgresql")
+def compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def post_rows():
+
+    # the select of GET /posts and /posts/{id}
+    return select(models.Post, models.Post.vote_count.label("votes")).options(joinedload(models.Post.user))
+
+
+def queries():
+
+    # name -> statement, one per query shape the api runs
+
+    cursor = utility.encode_cursor(datetime.now(timezone.utc), 10 ** 9)
+    post_in = schemas.PostIn(title="title", content="content")
+
+    return {
+        "posts page": post.filter_posts(post_rows(), "", None, 0).limit(10),
+        "posts cursor": post.filter_posts(post_rows(), "", cursor, 0).limit(10),
+        "posts search": post.filter_posts(post_rows(), "python index", None, 0).limit(10),
+        "post by id": post_rows().filter(models.Post.id == 1),
+        "ranked posts": post.ranked_posts([1, 2]),
+        "update own post": post.update_own_post(1, 1, post_in),
+        "delete own post": post.delete_own_post(1, 1),
+        "posts of user": select(models.Post.id).filter(models.Post.user_id == 1),  # cascade from users
+        "add vote": vote.add_vote(1, 1),
+        "remove vote": vote.remove_vote(1, 1),
+        "insert votes": vote.insert_votes(1, [1, 2]),
+        "delete votes": vote.delete_votes(1, [1, 2]),
+        "update vote counts": vote.update_vote_counts({1}, {2}),
+        "votes of user": select(models.Vote.post_id).filter(models.Vote.user_id == 1),  # cascade from users
+        "top posts": ranking.top_query(),
+        "trending posts": ranking.trending_query(),
+        "current user": select(models.User).filter(models.User.id == 1),  # oauth2.get_current_user
+        "login": select(models.User).filter(models.User.email == "bench0@example.com"),  # routers/auth.py
+    }
+
+
+def seq_scans(plan):
+
+    # every Seq Scan node of a plan tree, subplans and ctes included
+    if plan["Node Type"] == "Seq Scan":
+        yield plan
+
+    for child in plan.get("Plans", ()):
+        yield from seq_scans(child)
+
+
+def table_rows(db):
+
+    rows = db.execute(text(
+        "SELECT relname, reltuples FROM pg_class WHERE relname IN ('users', 'posts', 'votes')"
+    ))
+
+    return {name: rows for name, rows in rows}
+
+
+def check_plans(db, max_rows):
+
+    # returns (lines, failures), rolled back: nothing is executed but better safe
+
+    sizes = table_rows(db)
+    lines, failures = [], 0
+
+    try:
+        for name, statement in queries().items():
+            # core execution, the orm would try to load Post objects from the plan
+            plan = db.connection().execute(Explain(statement)).scalar()[0]["Plan"]
+
+            scanned = [
+                (scan["Relation Name"], sizes.get(scan["Relation Name"], 0))
+                for scan in seq_scans(plan)
+                if sizes.get(scan["Relation Name"], 0) > max_rows
+            ]
+
+            if scanned:
+                failures += 1
+                tables = ", ".join(f"{table} (~{rows:.0f} rows)" for table, rows in scanned)
+                lines.append(f"FAIL  {name:<20} Seq Scan on {tables}")
+            else:
+                lines.append(f"ok    {name:<20} {plan['Node Type']}, cost {plan['Total Cost']}")
+
+    finally:
+        db.rollback()
+
+    return lines, failures
@@ -0,0 +1,251 @@
+import asyncio
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+
+import httpx
+import uvicorn
+from sqlalchemy import func
+
+from app import database, models
+from app.config import settings
+from app.main import app
+from . import seed
+
+""" LOAD SCENARIOS
+
+- each scenario builds request i as (method, url, httpx keyword arguments)
+- concurrency workers send requests back to back until the scenario has sent them all
+- latency is measured per request from the client, throughput over the whole scenario
+- queries per request: every statement the engine ran during the scenario / requests
+(the server runs in this process in both modes, so the engine's events see them)
+- kB per request: response bodies as sent, compressed when the server compressed them
+(httpx asks for gzip, and br when brotli is installed)
+
+modes:
+
+    in-process    httpx talks to the asgi app directly, no sockets (app + database cost)
+    uvicorn       a real uvicorn server on 127.0.0.1 in a background thread (+ http parsing, sockets)
+
+"""
+
+SCENARIOS = {}
+
+
+def scenario(name):
+
+    def register(build):
+        SCENARIOS[name] = build
+        return build
+
+    return register
+
+
+class Context:
+
+    # what the scenarios need to know about the seeded data
+
+    def __init__(self, users, posts, tokens, rng):
+        self.users = users
+        self.posts = posts
+        self.tokens = tokens
+        self.rng = rng
+
+    def auth(self, i):
+        return {"Authorization": f"Bearer {self.tokens[i % len(self.tokens)]}"}
+
+
+# -- Scenarios -----------------------------------------------------------------
+
+@scenario("login")
+def login(i, ctx):
+
+    return "POST", "/login/", {"data": {"username": seed.email(i % ctx.users), "password": seed.PASSWORD}}
+
+
+@scenario("posts")
+def get_all_posts(i, ctx):
+
+    return "GET", "/posts/", {"params": {"limit": 10}, "headers": ctx.auth(i)}
+
+
+@scenario("post")
+def get_post(i, ctx):
+
+    return "GET", f"/posts/{ctx.rng.randint(1, ctx.posts)}", {"headers": ctx.auth(i)}
+
+
+@scenario("vote")
+def vote(i, ctx):
+
+    # every token votes on a post, then takes the vote back on its next turn
+    # (409/404 still happen where the seeded votes already cover a pair)
+
+    turn = i // len(ctx.tokens)
+    post_id = (turn // 2) % ctx.posts + 1
+
+    return "POST", "/vote/", {"json": {"post_id": post_id, "dir": 1 - turn % 2}, "headers": ctx.auth(i)}
+
+
+@scenario("users")
+def get_all_users(i, ctx):
+
+    return "GET", "/users/", {}
+
+
+# -- Running -------------------------------------------------------------------
+
+def engine_bind():
+
+    # engine whose statements are counted (async engines emit their events on sync_engine)
+    return database.async_engine.sync_engine if settings.DATABASE_ASYNC else database.engine
+
+
+def seeded_counts():
+
+    db = database.SessionLocal()
+
+    try:
+        return db.query(func.count(models.User.id)).scalar(), db.query(func.count(models.Post.id)).scalar()
+    finally:
+        db.close()
+
+
+def summarize(latencies, statuses, elapsed, queries, downloaded=0):
+
+    requests = len(latencies)
+
+    if requests > 1:
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    else:
+        percentiles = latencies * 99
+
+    return {
+        "requests": requests,
+        "errors": sum(count for status, count in statuses.items() if status >= 500),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "rps": round(requests / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(1000 * percentiles[49], 3),
+        "p95_ms": round(1000 * percentiles[94], 3),
+        "p99_ms": round(1000 * percentiles[98], 3),
+        "queries_per_request": round(queries / requests, 2) if requests else 0.0,
+        "kb_per_request": round(downloaded / requests / 1000, 3) if requests else 0.0,
+    }
+
+
+async def send(client, name, ctx, requests, concurrency, start=0):
+
+    build = SCENARIOS[name]
+    latencies, statuses, downloaded = [], Counter(), [0]
+    numbers = iter(range(start, start + requests))  # shared by the workers
+
+    async def worker():
+        for i in numbers:
+            method, url, kwargs = build(i, ctx)
+
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+
+            statuses[response.status_code] += 1
+            downloaded[0] += response.num_bytes_downloaded
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    return latencies, statuses, downloaded[0]
+
+
+async def run_scenario(client, name, ctx, requests, concurrency, warmup):
+
+    if warmup:
+        await send(client, name, ctx, warmup, concurrency)
+
+    with database.count_queries(engine_bind()) as statements:
+        started = time.perf_counter()
+        latencies, statuses, downloaded = await send(client, name, ctx, requests, concurrency, start=warmup)
+        elapsed = time.perf_counter() - started
+
+    return summarize(latencies, statuses, elapsed, len(statements), downloaded)
+
+
+async def log_in(client, ctx, count):
+
+    for i in range(min(count, ctx.users)):
+        response = await client.post("/login/", data={"username": seed.email(i), "password": seed.PASSWORD})
+        response.raise_for_status()
+        ctx.tokens.append(response.json()["access_token"])
+
+
+@asynccontextmanager
+async def in_process_client():
+
+    # httpx does not send lifespan events, run the startup/shutdown handlers here
+    await app.router.startup()
+
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+            yield client
+    finally:
+        await app.router.shutdown()
+
+
+@asynccontextmanager
+async def uvicorn_client(port):
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    server.install_signal_handlers = lambda: None  # not the main thread
+
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"uvicorn did not start on port {port}")
+
+        await asyncio.sleep(0.05)
+
+    try:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits) as client:
+            yield client
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+async def run(names, requests, concurrency, warmup=0, uvicorn_port=None, random_seed=0):
+
+    database.create_engines()  # the app's startup handler makes them too, once per process
+    users, posts = seeded_counts()
+
+    if not users or not posts:
+        raise RuntimeError("database is empty, run: python -m bench seed")
+
+    ctx = Context(users, posts, [], random.Random(random_seed))
+    client_context = uvicorn_client(uvicorn_port) if uvicorn_port else in_process_client()
+
+    async with client_context as client:
+        await log_in(client, ctx, concurrency)
+
+        results = {}
+
+        for name in names:
+            results[name] = await run_scenario(client, name, ctx, requests, concurrency, warmup)
+
+    return {
+        "meta": {
+            "mode": "uvicorn" if uvicorn_port else "in-process",
+            "database_async": settings.DATABASE_ASYNC,
+            "fast_json": settings.FAST_JSON,
+            "users": users,
+            "posts": posts,
+            "requests": requests,
+            "concurrency": concurrency,
+            "warmup": warmup,
+        },
+        "scenarios": results,
+    }
@@ -0,0 +1,88 @@
+import random
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from sqlalchemy import insert, text
+
+from app import models, reconcile, utility
+
+""" SEED DATA
+
+- TRUNCATEs users, posts and votes, then fills them again: point the app's
+DATABASE_* settings at a scratch database before seeding
+- ids run from 1 (RESTART IDENTITY), so scenarios can pick them without a query
+- every user shares one password hash, hashing 10k passwords would take minutes
+- random.Random(seed): the same arguments always give the same data
+- votes are spread over the last VOTE_DAYS days, like a live table (GET /posts/trending only
+reads the recent ones), ANALYZE at the end gives the planner the new sizes (python -m bench plans)
+
+"""
+
+PASSWORD = "password"
+
+VOTE_DAYS = 30
+
+WORDS = (
+    "fastapi postgres python async index cache query vote post user token pool "
+    "cursor stream batch json latency throughput replica worker search rank"
+).split()
+
+
+def email(i):
+
+    # i: 0 based, user id is i + 1
+    return f"bench{i}@example.com"
+
+
+def insert_chunks(db, model, rows, chunk_size):
+
+    # executemany per chunk, rows is a generator so the whole table is never in memory
+    rows = iter(rows)
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+
+        if not chunk:
+            break
+
+        db.execute(insert(model), chunk)
+
+
+def seed(db, users, posts, votes, chunk_size=5000, seed=0):
+
+    rng = random.Random(seed)
+
+    db.execute(text("TRUNCATE votes, posts, users RESTART IDENTITY CASCADE"))
+
+    password = utility.hash_pwd(PASSWORD)
+
+    insert_chunks(db, models.User, ({"email": email(i), "password": password} for i in range(users)), chunk_size)
+
+    insert_chunks(db, models.Post, (
+        {
+            "title": " ".join(rng.choices(WORDS, k=4)),
+            "content": " ".join(rng.choices(WORDS, k=40)),
+            "user_id": rng.randint(1, users),
+        }
+        for _ in range(posts)
+    ), chunk_size)
+
+    # distinct (user, post) pairs, sampled without building every pair
+    pairs = rng.sample(range(users * posts), min(votes, users * posts))
+    now = datetime.now(timezone.utc)
+
+    insert_chunks(db, models.Vote, (
+        {
+            "user_id": pair // posts + 1,
+            "post_id": pair % posts + 1,
+            "created_at": now - timedelta(seconds=rng.uniform(0, VOTE_DAYS * 86400)),
+        }
+        for pair in pairs
+    ), chunk_size)
+
+    db.commit()
+
+    # posts.vote_count from the votes just inserted
+    reconcile.repair_drift(db)
+
+    db.execute(text("ANALYZE users, posts, votes"))
+    db.commit()
@@ -0,0 +1,81 @@
+import os
+
+# settings without a .env, nothing here connects to them
+for name, value in {
+    "DATABASE_HOSTNAME": "localhost", "DATABASE_PORT": "5432", "DATABASE_PASSWORD": "test",
+    "DATABASE_NAME": "test", "DATABASE_USERNAME": "test",
+    "SECRET_KEY": "test", "ALGORITHM": "HS256", "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "PASSWORD_HASH_WORKERS": "0", "BCRYPT_ROUNDS": "4", "LOGIN_THROTTLE_BACKEND": "off",
+}.items():
+    os.environ.setdefault(name, value)
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from starlette.testclient import TestClient
+
+from app import database, models, oauth2, cache
+from app.main import app
+
+""" TESTS
+
+the app against an in-memory sqlite database standing in for postgres, no server needed
+
+    pip install -r requirements-dev.txt
+    python -m pytest -q
+
+- the postgres full text search bits (tsvector column, to_tsvector, setweight) get
+sqlite stand-ins, enough to create the tables and insert posts
+- get_db is overridden, get_read_db (no replicas) hands out the same session
+- the response and auth caches are cleared before each test
+
+"""
+
+
+@compiles(TSVECTOR, "sqlite")
+def compile_tsvector(type_, compiler, **kw):
+    return "TEXT"
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+    @event.listens_for(engine, "connect")
+    def add_functions(dbapi_conn, record):
+        dbapi_conn.create_function("to_tsvector", 2, lambda config, text: text.lower(), deterministic=True)
+        dbapi_conn.create_function("setweight", 2, lambda vector, weight: vector, deterministic=True)
+
+    models.Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+
+@pytest.fixture
+def client(session_factory):
+
+    def get_db():
+        db = session_factory()
+
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[database.get_db] = get_db
+    cache.post_responses.clear()
+    oauth2.user_cache.clear()
+
+    yield TestClient(app)
+
+    app.dependency_overrides.clear()
+    cache.post_responses.clear()
+    oauth2.user_cache.clear()
@@ -0,0 +1,116 @@
+import pytest
+
+from app import cache
+from app.cache import LRUCache, ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+
+    return now
+
+
+# -- LRU -----------------------------------------------------------------------
+
+def test_lru_evicts_the_least_recently_used():
+
+    lru = LRUCache(2, 60)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")  # b is now the oldest
+    lru.set("c", 3)
+
+    assert lru.get("a") == 1
+    assert lru.get("b") is None
+    assert lru.get("c") == 3
+
+
+def test_lru_expires_after_ttl(clock):
+
+    lru = LRUCache(10, 30)
+    lru.set("a", 1)
+
+    clock[0] += 29
+    assert lru.get("a") == 1
+
+    clock[0] += 2
+    assert lru.get("a") is None
+    assert "a" not in lru.data
+
+
+def test_lru_size_zero_keeps_nothing():
+
+    lru = LRUCache(0, 60)
+    lru.set("a", 1)
+
+    assert lru.get("a") is None
+
+
+# -- Tags ----------------------------------------------------------------------
+
+@pytest.fixture
+def responses():
+
+    responses = ResponseCache(10, 60)
+    responses.set("/posts?limit=10", "page", tags=("posts", "post:1", "post:2"))
+    responses.set("/posts?search=python", "search", tags=("posts", "posts:search", "post:2"))
+    responses.set("/posts/1", "post 1", tags=("post:1",))
+
+    return responses
+
+
+def test_invalidate_tag_drops_every_entry_with_it(responses):
+
+    responses.invalidate_tag("post:2")
+
+    assert responses.get("/posts?limit=10") is None
+    assert responses.get("/posts?search=python") is None
+    assert responses.get("/posts/1") == "post 1"
+
+
+def test_invalidate_tag_leaves_no_stale_tags(responses):
+
+    responses.invalidate_tag("posts")
+
+    assert set(responses.data) == {"/posts/1"}
+    assert responses.tags == {"post:1": {"/posts/1"}}
+    assert responses.key_tags == {"/posts/1": ("post:1",)}
+
+
+def test_invalidate_unknown_tag_is_a_no_op(responses):
+
+    responses.invalidate_tag("post:99")
+
+    assert len(responses.data) == 3
+
+
+def test_set_again_replaces_the_tags(responses):
+
+    responses.set("/posts/1", "post 1 again", tags=("post:3",))
+    responses.invalidate_tag("post:1")
+
+    assert responses.get("/posts/1") == "post 1 again"
+    assert responses.get("/posts?limit=10") is None
+
+
+def test_eviction_drops_the_tags_too():
+
+    responses = ResponseCache(1, 60)
+    responses.set("/posts/1", "post 1", tags=("post:1",))
+    responses.set("/posts/2", "post 2", tags=("post:2",))
+
+    assert responses.tags == {"post:2": {"/posts/2"}}
+
+
+def test_invalidate_post(monkeypatch, responses):
+
+    monkeypatch.setattr(cache, "post_responses", responses)
+
+    cache.invalidate_post(1)  # a vote
+    assert set(responses.data) == {"/posts?search=python"}
+
+    cache.invalidate_post(3, searched=True)  # an edit
+    assert not responses.data
@@ -0,0 +1,152 @@
+import gzip
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app import compression
+from app.compression import CompressionMiddleware, accepted_encodings, choose_encoding
+from app.config import settings
+
+BIG = {"posts": [{"title": f"post {i}", "content": "content " * 10} for i in range(100)]}  # well above the minimum
+
+
+# -- Negotiation ---------------------------------------------------------------
+
+@pytest.fixture
+def no_brotli(monkeypatch):
+    monkeypatch.setattr(compression, "brotli", None)
+
+
+def test_accepted_encodings_parses_q_values():
+
+    assert accepted_encodings("gzip, br;q=0.8, *;q=0") == {"gzip": 1.0, "br": 0.8, "*": 0.0}
+    assert accepted_encodings("gzip;q=oops") == {"gzip": 0.0}
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip", "gzip"),
+    ("gzip;q=0", None),
+    ("identity", None),
+    ("", None),
+    ("*", "gzip"),
+    ("*;q=0", None),
+    ("*, gzip;q=0", None),
+    ("br", None),  # brotli not installed
+])
+def test_choose_encoding_without_brotli(no_brotli, accept_encoding, expected):
+
+    assert choose_encoding(accept_encoding) == expected
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip, br", "br"),  # tie goes to br
+    ("gzip, br;q=0.5", "gzip"),  # highest q wins
+    ("gzip;q=0.2, *;q=0.8", "br"),
+    ("br;q=0, gzip", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+])
+def test_choose_encoding_with_brotli(accept_encoding, expected):
+
+    pytest.importorskip("brotli")
+
+    assert choose_encoding(accept_encoding) == expected
+
+
+# -- Middleware ----------------------------------------------------------------
+
+def chunks():
+    for i in range(200):
+        yield f'{{"id": {i}, "title": "post {i}"}}\n'.encode()
+
+
+async def big(request):
+    return JSONResponse(BIG)
+
+
+async def small(request):
+    return JSONResponse({"detail": "ok"})
+
+
+async def stream(request):
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+
+async def short_stream(request):
+    return StreamingResponse(iter([b'{"id": 1}\n']), media_type="application/x-ndjson")
+
+
+async def image(request):
+    return Response(b"\x89PNG" * 1000, media_type="image/png")
+
+
+@pytest.fixture
+def client(no_brotli):
+
+    app = Starlette(routes=[
+        Route("/big", big), Route("/small", small), Route("/stream", stream),
+        Route("/short-stream", short_stream), Route("/image", image),
+    ])
+    app.add_middleware(CompressionMiddleware)
+
+    return TestClient(app)
+
+
+def test_big_body_is_gzipped(client):
+
+    response = client.get("/big", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert response.json() == BIG
+
+
+def test_small_body_goes_out_as_it_is_with_vary(client):
+
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.json() == {"detail": "ok"}
+
+
+@pytest.mark.parametrize("accept_encoding", ["identity", "gzip;q=0", ""])
+def test_uncompressed_response_still_varies(client, accept_encoding):
+
+    response = client.get("/big", headers={"Accept-Encoding": accept_encoding})
+
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.json() == BIG
+
+
+def test_not_compressible_is_left_alone(client):
+
+    response = client.get("/image", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert "vary" not in response.headers
+
+
+def test_stream_is_compressed_chunk_by_chunk(client):
+
+    response = client.get("/stream", headers={"Accept-Encoding": "gzip"}, stream=True)
+    raw = response.raw.read(decode_content=False)
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert gzip.decompress(raw) == b"".join(chunks())
+
+
+def test_short_stream_goes_out_as_it_is(client):
+
+    assert len(b'{"id": 1}\n') < settings.COMPRESSION_MIN_SIZE
+
+    response = client.get("/short-stream", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == b'{"id": 1}\n'
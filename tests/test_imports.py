@@ -0,0 +1,20 @@
+from bench.imports import IMPORT_BUDGET_MS, probe
+
+# -- Import Time ---------------------------------------------------------------
+# every worker imports the app before it serves, see main.py and bench/imports.py
+# (python -m bench imports also lists the slowest modules)
+
+
+def test_import_defers_engines_and_slow_modules():
+
+    result = probe()  # a fresh interpreter
+
+    assert not result["engine"], "importing the app created an engine"
+    assert result["imported"] == [], f"imported when the app is: {result['imported']}, expected on first use"
+
+
+def test_import_time_within_budget():
+
+    fastest_ms = 1000 * min(probe()["seconds"] for _ in range(5))  # as python -m bench imports
+
+    assert fastest_ms <= IMPORT_BUDGET_MS, f"import app.main took {fastest_ms:.0f} ms, budget {IMPORT_BUDGET_MS:.0f} ms"
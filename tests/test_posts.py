@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import database, models, oauth2, cache
+from app.config import settings
+
+
+@pytest.fixture
+def token(session_factory):
+
+    # 5 users with 12 posts each (authors alternate post by post), a token for the first
+    # created_at set here: sqlite keeps server defaults as text that does not compare with
+    # the cursor's datetime, two posts per minute so the id breaks ties
+
+    db = session_factory()
+    users = [models.User(email=f"test{i}@example.com", password="not a hash") for i in range(5)]
+    db.add_all(users)
+    db.commit()
+
+    db.add_all(
+        models.Post(
+            title=f"post {i}", content="content", user_id=users[i % 5].id,
+            created_at=datetime(2026, 1, 1) + timedelta(minutes=i // 2)
+        )
+        for i in range(60)
+    )
+    db.commit()
+
+    token = oauth2.create_access_token(data={"user_id": users[0].id})
+    db.close()
+
+    return token
+
+
+# -- Query Counts --------------------------------------------------------------
+# user lookup + posts joined with their authors, whatever the page size (no n + 1)
+
+def test_get_posts_query_count_does_not_grow_with_limit(client, engine, token):
+
+    counts = {}
+
+    for limit in (1, 50):
+        cache.post_responses.clear()
+        oauth2.user_cache.clear()
+
+        with database.count_queries(engine) as statements:
+            response = client.get(f"/posts?limit={limit}", headers={"Authorization": f"Bearer {token}"})
+
+        assert response.status_code == 200
+        assert len(response.json()) == limit
+
+        counts[limit] = len(statements)
+
+    assert counts[1] == counts[50] == 2
+
+
+# -- Page Size -----------------------------------------------------------------
+# pages are cached, a client cannot make one hold more than POSTS_MAX_LIMIT posts
+
+def test_get_posts_rejects_limits_above_the_maximum(client, token):
+
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get(f"/posts?limit={settings.POSTS_MAX_LIMIT}", headers=headers).status_code == 200
+    assert client.get(f"/posts?limit={settings.POSTS_MAX_LIMIT + 1}", headers=headers).status_code == 422
+    assert client.get("/posts?limit=0", headers=headers).status_code == 422
+    assert client.get("/posts?offset=-1", headers=headers).status_code == 422
+
+
+# -- Cursors -------------------------------------------------------------------
+
+def test_get_posts_follows_the_cursor_to_the_end(client, token):
+
+    headers = {"Authorization": f"Bearer {token}"}
+    seen, cursor = [], None
+
+    for page in range(4):  # 25 + 25 + 10, then no cursor
+        response = client.get("/posts", params={"limit": 25, "cursor": cursor}, headers=headers)
+        seen += [post["Post"]["id"] for post in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+
+        if cursor is None:
+            break
+
+    assert cursor is None
+
+    assert seen == sorted(seen, reverse=True)  # newest first, no post twice
+    assert len(set(seen)) == 60
+
+
+def test_get_posts_rejects_a_bad_cursor(client, token):
+
+    response = client.get("/posts?cursor=not-a-cursor", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 400
+    assert "invalid cursor" in response.json()["detail"]
@@ -0,0 +1,121 @@
+import pytest
+
+from app import ranking
+from app.ranking import TopPosts, TrendingPosts
+
+
+# -- Top -----------------------------------------------------------------------
+# rows: (post id, votes), best first
+
+@pytest.fixture
+def top():
+
+    top = TopPosts(3)
+    top.load([(10, 5), (11, 4), (12, 3)])  # full: posts left out have at most 3 votes
+
+    return top
+
+
+def test_top_reads_best_first(top):
+
+    assert top.read(3) == [10, 11, 12]
+    assert top.read(2) == [10, 11]
+
+
+def test_top_clamps_limit_to_its_size(top):
+
+    assert top.read(4) == [10, 11, 12]  # not None, that would reload on every request
+
+
+def test_top_evicts_the_last_post_and_raises_the_floor(top):
+
+    top.record(13, 3)  # ties with 12, newer first
+
+    assert top.read(3) == [10, 11, 13]
+    assert top.floor == (3, 12)
+
+
+def test_top_ignores_posts_below_the_floor(top):
+
+    top.record(14, 2)
+
+    assert 14 not in top.scores
+    assert top.read(3) == [10, 11, 12]
+
+
+def test_top_is_not_exact_when_a_post_drops_below_the_floor(top):
+
+    top.record(10, 1)  # posts outside the ranking could have up to 3 votes
+
+    assert top.read(3) is None
+    assert top.read(3, check_stale=False) == [11, 12]
+    assert top.read(2) == [11, 12]
+
+
+def test_top_without_a_floor_returns_fewer_posts(top):
+
+    top.load([(10, 5)])  # every post with votes is loaded
+
+    assert top.read(3) == [10]
+
+
+# -- Trending ------------------------------------------------------------------
+
+@pytest.fixture
+def clock(monkeypatch):
+
+    now = [1_000_000.0]
+    monkeypatch.setattr(ranking.time, "time", lambda: now[0])
+
+    return now
+
+
+@pytest.fixture
+def trending(clock):
+
+    trending = TrendingPosts(10)
+    trending.load([])
+
+    return trending
+
+
+def test_trending_weighs_recent_votes_more(trending, clock):
+
+    trending.record(1, 1)
+    trending.record(1, 1)  # 2 now
+
+    clock[0] += trending.half_life / 2
+    trending.record(3, 1)  # 1.41
+
+    clock[0] += trending.half_life * 1.5
+    trending.record(2, 1)  # 4 relative to the first votes
+
+    assert trending.read(10) == [2, 1, 3]
+    assert trending.scores[2] == pytest.approx(2 * trending.scores[1])
+
+
+def test_trending_unlike_removes_a_post_without_votes(trending):
+
+    trending.record(1, 1)
+    trending.record(1, 0)
+
+    assert 1 not in trending.scores
+    assert trending.read(10) == []
+
+
+def test_trending_rebases_instead_of_overflowing(trending, clock):
+
+    trending.record(1, 1)
+    trending.record(1, 1)
+    trending.record(2, 1)
+
+    clock[0] += trending.half_life * 100
+    trending.record(3, 1)  # rebased: older scores scaled down, order kept
+
+    assert trending.epoch == clock[0]
+    assert trending.read(10) == [3, 1, 2]
+
+    clock[0] += trending.half_life * 10_000  # 2 ** 10000 overflows a float
+    trending.record(4, 1)
+
+    assert trending.read(1) == [4]
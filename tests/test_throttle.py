@@ -0,0 +1,45 @@
+import pytest
+
+from app import throttle
+from app.throttle import MemoryBackend
+
+
+@pytest.fixture
+def clock(monkeypatch):
+
+    now = [1000.0]
+    monkeypatch.setattr(throttle.time, "monotonic", lambda: now[0])  # the time module, also the buckets' expiry
+
+    return now
+
+
+def test_burst_then_rate(clock):
+
+    backend = MemoryBackend()
+
+    for _ in range(3):
+        assert backend.take("1.2.3.4", rate=0.5, burst=3) == 0
+
+    assert backend.take("1.2.3.4", rate=0.5, burst=3) == pytest.approx(2)  # one token every 2 s
+
+    clock[0] += 2
+    assert backend.take("1.2.3.4", rate=0.5, burst=3) == 0
+    assert backend.take("1.2.3.4", rate=0.5, burst=3) > 0
+
+
+def test_keys_have_their_own_buckets(clock):
+
+    backend = MemoryBackend()
+    backend.take("a", rate=1, burst=1)
+
+    assert backend.take("a", rate=1, burst=1) > 0
+    assert backend.take("b", rate=1, burst=1) == 0
+
+
+def test_refill_never_exceeds_burst(clock):
+
+    backend = MemoryBackend()
+    backend.take("a", rate=1, burst=2)
+
+    clock[0] += 3600  # the bucket expired, back to a full burst, not 3600 tokens
+    assert [backend.take("a", rate=1, burst=2) for _ in range(3)][-1] > 0
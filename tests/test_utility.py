@@ -0,0 +1,80 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app import utility
+from app.config import settings
+
+
+# -- Password Pool -------------------------------------------------------------
+
+def exit_worker():
+
+    # runs in a pool worker, dies like an oom kill would
+    os._exit(1)
+
+
+@pytest.fixture
+def pwd_pool(monkeypatch):
+
+    monkeypatch.setattr(settings, "PASSWORD_HASH_WORKERS", 1)
+    yield
+    utility.shutdown_pwd_pool()
+
+
+def test_pwd_pool_recovers_after_a_worker_dies(pwd_pool):
+
+    hashed = utility.hash_pwd("secret")
+    broken = utility.pwd_pool
+
+    with pytest.raises(BrokenProcessPool):  # dies again on the retry
+        utility.run_in_pwd_pool(exit_worker)
+
+    assert utility.pwd_pool is not broken
+    assert utility.verify_pwd("secret", hashed)
+
+
+def test_pwd_pool_retries_once_on_a_broken_pool(pwd_pool):
+
+    hashed = utility.hash_pwd("secret")
+    broken = utility.pwd_pool
+
+    for process in list(broken._processes.values()):
+        process.kill()
+        process.join()
+
+    assert asyncio.run(utility.verify_and_update_pwd_async("secret", hashed)) == (True, None)
+    assert utility.pwd_pool is not broken
+
+
+# -- Cursors -------------------------------------------------------------------
+
+@pytest.mark.parametrize("created_at", [
+    datetime(2026, 10, 18, 9, 12, 4, 511203, tzinfo=timezone.utc),
+    datetime(2026, 1, 1),
+])
+def test_cursor_round_trip(created_at):
+
+    cursor = utility.encode_cursor(created_at, 42)
+
+    assert "=" not in cursor  # no padding, safe in a query string as it is
+    assert utility.decode_cursor(cursor) == (created_at, 42)
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not a cursor",
+    "%%%",
+    utility.encode_cursor(datetime(2026, 1, 1), 1)[:-3],  # cut short
+    "bm8gc2VwYXJhdG9y",  # "no separator"
+    "MjAyNi0wMS0wMXxub3QgYW4gaWQ",  # "2026-01-01|not an id"
+    "bm90IGEgZGF0ZXwx",  # "not a date|1"
+    "_w",  # not utf-8
+])
+def test_bad_cursor_raises_value_error(cursor):
+
+    with pytest.raises(ValueError, match="invalid cursor"):
+        utility.decode_cursor(cursor)